@@ -0,0 +1,122 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# Offline fixtures for the benchmark suite
+#
+# Builds a workspace with the repository layout under a scratch directory, from the
+# committed daily_ts.csv, weekly_ts.csv, POPCTRS_30.csv, master.csv and concordance sheets.
+# A fixture at scale k repeats every health region k times ("Calgary", "Calgary 1", ...),
+# and the boundary file is synthesized with one polygon per case region, so nothing is downloaded.
+
+import os
+import sys
+import shutil
+import numpy as np
+import pandas as pd
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from common import paths, store
+
+
+REPO = {name: getattr(paths, name) for name in dir(paths) if name.isupper()}
+
+# the RegionalHealthBoundaries columns mergeHR drops
+POPULATION = ['TotalPop20',
+       'Pop0to4_20', 'Pop5to9_20', 'Pop10to14_', 'Pop15to19_', 'Pop20to24_',
+       'Pop25to29_', 'Pop30to34_', 'Pop35to39_', 'Pop40to44_', 'Pop45to49_',
+       'Pop50to54_', 'Pop55to59_', 'Pop60to64_', 'Pop65to69_', 'Pop70to74_',
+       'Pop75to79_', 'Pop80to84_', 'Pop85Older', 'AverageAge', 'MedianAge_',
+       'Last_Updat','NewCases7D', 'PopUnder20', 'Pop20to49', 'Pop50to69', 'Pop70to84',
+       'PopOver85']
+
+
+def relocate(root):
+    """
+    points every repository location in common/paths.py at root
+    (remote sources are pointed at their local fixtures)
+    must run before the stage modules are imported, they read paths at import time
+    """
+    for name, value in REPO.items():
+        if value.startswith(REPO['ROOT']):
+            setattr(paths, name, root + value[len(REPO['ROOT']):])
+
+    paths.CASES_SOURCE = os.path.join(root, 'collect', 'data', 'upstream.csv')
+
+
+def repeat(df, scale, columns):
+    """
+    repeats df scale times, suffixing columns with the copy number (the first copy is unchanged)
+    """
+    parts = []
+    for k in range(scale):
+        part = df.copy()
+        if k:
+            for c in columns:
+                part[c] = part[c].astype(str) + ' {}'.format(k)
+        parts.append(part)
+    return pd.concat(parts, ignore_index = True)
+
+
+def boundaries(weekly):
+    """
+    one polygon per case health region, named so that the cleaning rules match it
+    """
+    import geopandas as gpd
+    from shapely.geometry import Point
+
+    sys.path.append(os.path.join(REPO['ROOT'], 'wrangle', 'cases'))
+    import normalize
+
+    regions = weekly[['province', 'health_region']].drop_duplicates()
+    regions = regions.loc[~regions.province.isin(['NWT', 'Yukon', 'Nunavut'])]
+    names = normalize.clean_cases(regions).clean_name.drop_duplicates().reset_index(drop = True)
+
+    hr = pd.DataFrame({
+        'OBJECTID': np.arange(len(names)),
+        'HR_UID': (1000 + np.arange(len(names))).astype(str),
+        'ENGNAME': names,
+        'FRENAME': names,
+        'SourceURL': 'https://example.org',
+        'SHAPE_Leng': 1.0,
+        'SHAPE_Area': 1.0,
+    })
+    for c in POPULATION:
+        hr[c] = 0
+
+    # detailed polygons, like the real boundaries
+    geometry = [Point(i % 40, i // 40).buffer(0.45, 64) for i in range(len(names))]
+    return gpd.GeoDataFrame(hr, geometry = geometry, crs = 'EPSG:4326')
+
+
+def build(root, scale):
+    """
+    root is an empty scratch directory, scale the number of copies of every health region
+    """
+    for d in ['collect/data/hr_boundaries', 'collect/data/POPCTRS', 'wrangle/data/shapefiles',
+              'wrangle/data/interventions', 'viz/CovidTimeline/data/input']:
+        os.makedirs(os.path.join(root, d), exist_ok = True)
+
+    relocate(root)
+
+    # upstream csv: grouped by region then date, dd-mm-yyyy dates, no index
+    daily = pd.read_csv(REPO['DAILY'] + '.csv', index_col = 0)
+    upstream = repeat(daily, scale, ['health_region'])
+    upstream['date_report'] = pd.to_datetime(upstream.date_report).dt.strftime('%d-%m-%Y')
+    upstream.to_csv(paths.CASES_SOURCE, index = False)
+
+    weekly = repeat(pd.read_csv(REPO['WEEKLY'] + '.csv'), scale, ['health_region'])
+    weekly = weekly.sort_values(['province', 'health_region', 'date_report'])
+    store.write(weekly.set_index(['province', 'health_region', 'date_report']), paths.WEEKLY)
+
+    boundaries(weekly).to_file(paths.HR_BOUNDARIES)
+
+    popctrs = repeat(pd.read_csv(REPO['POPCTRS']), scale, ['POPCTRRAname', 'Health Region'])
+    popctrs.to_csv(paths.POPCTRS, index = False)
+
+    master = pd.read_csv(REPO['MASTER'] + '.csv', index_col = 0)
+    store.write(pd.concat([master] * scale, ignore_index = True), paths.MASTER)
+
+    for sheet in ['CONCORDANCE', 'STANDARDS']:
+        shutil.copy(REPO[sheet], getattr(paths, sheet))
+
+    return root
@@ -0,0 +1,361 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# Benchmark suite and golden-output check
+#
+# Runs update_cases, mergeHR, top30 and retrieve_industry on offline fixtures (bench/fixtures.py)
+# at several scales and records wall time, CPU time, peak RSS and output size per stage.
+# Every stage runs in its own process so peak RSS is the stage's, not the suite's.
+# At scale 1 the stage outputs are hashed and compared with bench/golden.json,
+# so a speedup that changes the exported data fails the run. update_cases is also checked to
+# append nothing on an incremental refresh without new upstream rows, and to write the same
+# weekly series incrementally as a full rebuild; the summary cube is checked to carry the daily
+# running totals of a health region starting mid-series.
+#
+#   python bench/run.py                          # scales 1 10 100, all stages
+#   python bench/run.py --scales 1 --stages update_cases mergeHR
+#   python bench/run.py --update-golden          # after an intended change of outputs
+#
+# COVID_INTERMEDIATE_FORMAT picks the intermediate format as for the pipeline.
+
+import os
+import sys
+import json
+import time
+import glob
+import shutil
+import hashlib
+import argparse
+import resource
+import tempfile
+import subprocess
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.join(HERE, '..'))
+
+GOLDEN = os.path.join(HERE, 'golden.json')
+
+STAGES = ['update_cases', 'mergeHR', 'top30', 'retrieve_industry']
+
+# stages reading another stage's outputs
+AFTER = {'top30': 'mergeHR'}
+
+GEO_STAGES = ['mergeHR', 'top30']
+
+
+def canonical(df):
+    """
+    sha256 of df's values, independent of row order, dtypes and the intermediate format
+    """
+    import pandas as pd
+
+    df = pd.DataFrame(df).reset_index(drop = not any(df.index.names)).copy()
+    for c in df.columns:
+        if c == 'geometry':
+            import shapely
+            df[c] = shapely.to_wkt(df[c].values, rounding_precision = 6)
+        elif pd.api.types.is_datetime64_any_dtype(df[c]):
+            df[c] = df[c].dt.strftime('%Y-%m-%d')
+        elif c == 'Industry':
+            # retrieve_industry joins a set, tag order is arbitrary
+            df[c] = df[c].map(lambda x: ', '.join(sorted(x.split(', '))))
+    # missing values print as nan, None or <NA> depending on the dtype
+    df = df.astype(object).where(df.notna(), '').astype(str)
+
+    # geometry is stored apart from the attributes in a shapefile, its position is arbitrary
+    columns = [c for c in df.columns if c != 'geometry'] + [c for c in df.columns if c == 'geometry']
+    text = df[columns].sort_values(columns).to_csv(index = False)
+    return {'rows': len(df), 'sha256': hashlib.sha256(text.encode()).hexdigest()}
+
+
+def size(files):
+    """
+    bytes written to files, shapefiles with their sidecars
+    """
+    total = 0
+    for f in files:
+        matches = glob.glob(os.path.splitext(f)[0] + '.*') if f.endswith('.shp') else [f]
+        total += sum(os.path.getsize(m) for m in matches if os.path.exists(m))
+    return total
+
+
+def stage(name, root):
+    """
+    runs the stage name in the workspace root
+    returns its output (a DataFrame, or a tuple of them) and the files it wrote
+    """
+    import fixtures
+    fixtures.relocate(root)
+
+    # the stage modules read common.paths at import time
+    from common import paths, store
+
+    if name == 'update_cases':
+        sys.path.append(os.path.join(fixtures.REPO['ROOT'], 'collect'))
+        import cases
+        return cases.update_cases(), [store.path_for(paths.DAILY), store.path_for(paths.WEEKLY)]
+
+    if name == 'mergeHR':
+        sys.path.append(os.path.join(fixtures.REPO['ROOT'], 'wrangle', 'cases'))
+        import mergeHR
+        # cold run: no crosswalk nor geometry from a previous run
+        for f in glob.glob(paths.HR_CROSSWALK + '*') + glob.glob(paths.HR_GEOMETRY + '.*'):
+            os.remove(f)
+        return mergeHR.mergeHR(), [paths.HR_CROSSWALK, store.path_for(paths.HR_GEOMETRY, geo = True),
+                                   store.path_for(paths.HR_CASES)]
+
+    if name == 'top30':
+        sys.path.append(os.path.join(fixtures.REPO['ROOT'], 'wrangle', 'cases'))
+        import top30
+        before = set(glob.glob(os.path.join(paths.VIZ_INPUT, 'cases_*.shp')))
+        final = top30.top30()
+        return final, sorted(set(glob.glob(os.path.join(paths.VIZ_INPUT, 'cases_*.shp'))) - before) or \
+            glob.glob(os.path.join(paths.VIZ_INPUT, 'cases_*.shp'))
+
+    if name == 'retrieve_industry':
+        sys.path.append(os.path.join(fixtures.REPO['ROOT'], 'wrangle', 'interventions'))
+        import interventionsUpdate as iu
+        master = store.read(paths.MASTER, index_col = 0)
+        d = iu.industries_dict()
+        return iu.tag_industries(master['Summary'], d).to_frame('Industry'), []
+
+    raise ValueError('Unknown stage: {}'.format(name))
+
+
+def incremental_check(root):
+    """
+    holds one health region back for a refresh, then refreshes again without new upstream rows:
+    the second refresh must not append anything, and the weekly series must end up as a full
+    rebuild writes it (the workspace's collect/data is restored afterwards)
+    """
+    import pandas as pd
+    from common import paths, store
+    from common.fetch import fetch
+    from common.timeseries import read_weekly
+    import cases
+
+    data = os.path.join(root, 'collect', 'data')
+    backup = data + '.incremental'
+    shutil.copytree(data, backup)
+
+    try:
+        upstream = pd.read_csv(paths.CASES_SOURCE)
+        dates = pd.to_datetime(upstream.date_report, format = '%d-%m-%Y')
+        last = dates == dates.max()
+        held = (upstream.province == upstream.province[last].iloc[0]) & (upstream.health_region == upstream.health_region[last].iloc[0])
+
+        def refresh(rows, incremental = True):
+            upstream.loc[rows].to_csv(paths.CASES_SOURCE, index = False)
+            # sources are read once per process
+            fetch.cache_clear()
+            before = len(store.read(paths.DAILY)) if incremental else 0
+            cases.update_cases(incremental = incremental)
+            return len(store.read(paths.DAILY)) - before
+
+        refresh(~last, incremental = False)
+        appended = [refresh(~(last & held)), refresh(~(last & held)), refresh(last | ~last), refresh(last | ~last)]
+
+        expected = [int((last & ~held).sum()), 0, int((last & held).sum()), 0]
+        if appended != expected:
+            raise AssertionError("incremental refreshes appended {} rows, expected {}".format(appended, expected))
+
+        appended = canonical(read_weekly(paths.WEEKLY))
+        refresh(last | ~last, incremental = False)
+        if appended != canonical(read_weekly(paths.WEEKLY)):
+            raise AssertionError("incremental refreshes wrote another weekly series than a full rebuild")
+        return 'ok'
+
+    finally:
+        shutil.rmtree(data)
+        shutil.move(backup, data)
+
+
+def cumulative_check(root):
+    """
+    starts one health region mid-series, on a Wednesday, and builds the summary cube from the daily
+    series: the cube's cumulative_cases must be the region's daily running total at the end of each week
+    """
+    import pandas as pd
+    from common import paths, store
+    from common.resample import weekly_sums
+    from common.timeseries import read_upstream
+    sys.path.append(os.path.join(HERE, '..', 'wrangle', 'summary'))
+    import mergeHR
+    import metrics
+    import cube
+
+    geometry = store.read_geo(paths.HR_GEOMETRY)
+    crosswalk = metrics.read_crosswalk()
+    regions, population = cube.dashboard_regions(geometry)
+
+    daily = read_upstream(paths.CASES_SOURCE)
+    late = crosswalk.loc[crosswalk.HR_UID.isin(regions.HR_UID)].iloc[0]
+    start = pd.Timestamp('2020-09-02')
+    held = (daily.province.astype(str) == late.province) & (daily.health_region.astype(str) == late.health_region)
+    daily = daily.loc[~held | (daily.date_report >= start)]
+
+    weekly = weekly_sums(daily.loc[daily.date_report >= '2020-07-20']).reset_index()
+    facts = mergeHR.case_facts(mergeHR.provincial(weekly), crosswalk.dropna(subset = ['HR_UID']))
+    summary = cube.summaryCube((geometry, facts), interventions = pd.DataFrame(columns = ['Health Region', 'Implemented', 'Category']),
+                               metrics = metrics.case_metrics(daily, crosswalk, population))
+
+    # brute force: daily running totals of the boundary, the last one of each week
+    days = pd.merge(daily, crosswalk[['province', 'health_region', 'HR_UID']].drop_duplicates(), on = ['province', 'health_region'])
+    days = days.groupby(['HR_UID', 'date_report']).cumulative_cases.sum().reset_index()
+    days['week'] = days.date_report + pd.to_timedelta((7 - days.date_report.dt.weekday) % 7, unit = 'D')
+    expected = days.groupby(['HR_UID', 'week']).cumulative_cases.last()
+
+    got = summary.astype({'HR_UID': str}).set_index(['HR_UID', 'week']).cumulative_cases
+    wrong = got.loc[got != expected.reindex(got.index)]
+    if len(wrong) or not (got.loc[late.HR_UID].index.min() == start + pd.Timedelta(days = 5)):
+        raise AssertionError("summary cube cumulative_cases differ from the daily running totals for {}".format(
+            sorted(set(wrong.index.get_level_values(0))) or [late.HR_UID]))
+    return 'ok'
+
+
+def worker(name, root, golden):
+    """
+    runs one stage and prints its measurements as JSON
+    """
+    sys.path.append(HERE)
+    # measure the work, not a memoized result of a previous repeat (see common/cache.py)
+    os.environ['COVID_MEMO'] = 'off'
+
+    baseline = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    wall, cpu = time.perf_counter(), time.process_time()
+
+    output, files = stage(name, root)
+
+    wall, cpu = time.perf_counter() - wall, time.process_time() - cpu
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    record = {'seconds': round(wall, 3), 'cpu_seconds': round(cpu, 3),
+              'peak_rss_mb': round(peak / 1024, 1), 'stage_rss_mb': round((peak - baseline) / 1024, 1),
+              'output_bytes': size(files)}
+
+    if golden:
+        outputs = output if isinstance(output, tuple) else (output,)
+        record['golden'] = [canonical(o) for o in outputs]
+        if name == 'update_cases':
+            record['incremental'] = incremental_check(root)
+        if name == 'mergeHR':
+            record['cumulative'] = cumulative_check(root)
+
+    print(json.dumps(record))
+
+
+def call(*args):
+    """
+    runs this script in a new process, the peak RSS of a process is inherited by its children
+    returns the last line printed
+    """
+    proc = subprocess.run([sys.executable, os.path.abspath(__file__)] + list(args),
+                          stdout = subprocess.PIPE, stderr = subprocess.PIPE, universal_newlines = True)
+    if proc.returncode:
+        raise RuntimeError('{} failed:\n{}'.format(' '.join(args), proc.stderr))
+    return proc.stdout.strip().splitlines()[-1]
+
+
+def measure(name, root, golden):
+    return json.loads(call('--worker', name, root, *(['--golden'] if golden else [])))
+
+
+def geo_available():
+    try:
+        import geopandas
+        return True
+    except ImportError:
+        return False
+
+
+def main(scales, names, repeat = 1, update_golden = False, out = None, keep = False):
+    from common import store
+
+    golden = {}
+    if os.path.exists(GOLDEN):
+        with open(GOLDEN) as f:
+            golden = json.load(f)
+
+    # upstream stages come along, in suite order
+    wanted = set(names)
+    wanted.update(AFTER[n] for n in names if n in AFTER)
+    names = [n for n in STAGES if n in wanted]
+
+    if not geo_available():
+        print("geopandas is not installed, skipping {}".format(', '.join(GEO_STAGES)))
+        names = [n for n in names if n not in GEO_STAGES]
+
+    records, failed = [], []
+
+    for scale in scales:
+        root = tempfile.mkdtemp(prefix = 'covid-bench-{}x-'.format(scale))
+        print("Building {}x fixtures in {}".format(scale, root))
+        call('--build', str(scale), root)
+
+        for name in names:
+            runs = [measure(name, root, scale == 1) for _ in range(repeat)]
+            record = dict(min(runs, key = lambda r: r['seconds']), stage = name, scale = scale,
+                          format = store.resolve())
+
+            if scale == 1:
+                hashes = record.pop('golden')
+                if update_golden:
+                    golden[name] = hashes
+                    record['check'] = 'updated'
+                elif name not in golden:
+                    record['check'] = 'no golden'
+                elif golden[name] == hashes:
+                    record['check'] = 'ok'
+                else:
+                    record['check'] = 'CHANGED'
+                    failed.append(name)
+
+            records.append(record)
+
+        if not keep:
+            shutil.rmtree(root)
+
+    if update_golden:
+        with open(GOLDEN, 'w') as f:
+            json.dump(golden, f, indent = 2, sort_keys = True)
+            f.write('\n')
+
+    print("\n{:<20}{:>7}{:>10}{:>10}{:>10}{:>14}  {}".format("Stage", "Scale", "Seconds", "CPU", "RSS MB", "Output bytes", "Golden"))
+    for r in records:
+        print("{:<20}{:>6}x{:>10.2f}{:>10.2f}{:>10.1f}{:>14}  {}".format(
+            r['stage'], r['scale'], r['seconds'], r['cpu_seconds'], r['peak_rss_mb'], r['output_bytes'], r.get('check', '')))
+
+    if out:
+        with open(out, 'a') as f:
+            for r in records:
+                f.write(json.dumps(r) + '\n')
+
+    if failed:
+        print("\nOutputs changed for: {}".format(', '.join(failed)))
+        sys.exit(1)
+
+    return records
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description = 'Benchmark the case and intervention stages on offline fixtures.')
+    parser.add_argument('--scales', type = int, nargs = '+', default = [1, 10, 100],
+                        help = 'copies of every health region in the fixtures')
+    parser.add_argument('--stages', nargs = '+', default = STAGES, choices = STAGES)
+    parser.add_argument('--repeat', type = int, default = 1, help = 'runs per stage, the fastest is kept')
+    parser.add_argument('--update-golden', action = 'store_true', help = 'record the scale 1 outputs as golden')
+    parser.add_argument('--out', help = 'append the measurements to this JSON-lines file')
+    parser.add_argument('--keep', action = 'store_true', help = 'keep the fixture workspaces')
+    parser.add_argument('--worker', nargs = 2, metavar = ('STAGE', 'ROOT'), help = argparse.SUPPRESS)
+    parser.add_argument('--golden', action = 'store_true', help = argparse.SUPPRESS)
+    parser.add_argument('--build', nargs = 2, metavar = ('SCALE', 'ROOT'), help = argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.build:
+        sys.path.append(HERE)
+        import fixtures
+        print(fixtures.build(args.build[1], int(args.build[0])))
+    elif args.worker:
+        worker(args.worker[0], args.worker[1], args.golden)
+    else:
+        main(args.scales, args.stages, args.repeat, args.update_golden, args.out, args.keep)
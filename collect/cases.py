@@ -1,46 +1,265 @@
 #!/usr/bin/env python
 # coding: utf-8
 
+import os
+import sys
+import json
 import pandas as pd
 import datetime as dt
 import schedule
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from common import cache, paths, store
+from common.fetch import local_path, open_source
+from common.resample import weekly_sums, weekly_sums_parallel
+from common.timeseries import iter_upstream, read_cases, read_upstream, read_weekly
 
-class Cases:
-    
-    def __init__(self, fnc):
-        
-        self._fnc = fnc
-        
-    def __call__(self, *args, **kwargs):
-        
-        return self._fnc(*args, **kwargs)
+SOURCE = paths.CASES_SOURCE
+STATE = os.path.join(paths.COLLECT_DATA, 'ingest_state.json')
 
-    
 
-@Cases
-def update_cases():
-    daily = pd.read_csv('https://raw.githubusercontent.com/ishaberry/Covid19Canada/master/timeseries_hr/cases_timeseries_hr.csv')
+def week_ending(dates):
+    """
+    dates is a datetime series
+    labels each date with the Monday closing its W-Mon bucket (same as resample('W-Mon'))
+    """
+    return dates + pd.to_timedelta((7 - dates.dt.weekday) % 7, unit = 'D')
 
-    # convert to datetime object
-    daily.date_report = daily.date_report.map(lambda x: dt.datetime.strptime(x, '%d-%m-%Y'))
 
-    # only grab from July 20, 2020 onwards
-    print("Retaining everything on and after july 20, 2020.")
-    july20 = daily.loc[daily.date_report >= "2020-07-20"]
-    
-    # resample to weekly & export
-    july20.groupby(['province','health_region']).resample('W-Mon', on = 'date_report').sum().to_csv('data/weekly_ts.csv')
+WEEKLY_COLUMNS = ['province', 'health_region', 'date_report', 'cases', 'cumulative_cases']
+
+
+def load_state():
+    """
+    returns the last ingested date_report per health region, or None before the first run
+    """
+    if not (os.path.exists(STATE) and store.exists(paths.DAILY) and store.exists(paths.WEEKLY)):
+        return None
+
+    with open(STATE) as f:
+        return json.load(f)
+
+
+def save_state(daily, rows, previous = None, weeks = None):
+    """
+    daily is every row ingested so far (or at least the latest per region)
+    rows is the number of rows in daily_ts, used to continue its index
+    previous is the last_report of the state being updated: regions without a row in daily keep theirs
+    weeks is the byte offset of each week in weekly_ts.csv (see write_weeks), None when it is not ordered by week
+    """
+    last = daily.groupby(['province', 'health_region'], observed = True).date_report.max()
+
+    last_report = dict(previous or {})
+    for (p, h), d in last.items():
+        key = '{}|{}'.format(p, h)
+        last_report[key] = max(last_report.get(key, ''), d.strftime('%Y-%m-%d'))
+
+    state = {
+        'rows': int(rows),
+        'last_report': last_report
+    }
+    if weeks is not None:
+        state['weeks'] = weeks
+        state['weekly_bytes'] = os.path.getsize(store.path_for(paths.WEEKLY, 'csv'))
+
+    with open(STATE, 'w') as f:
+        json.dump(state, f, indent = 1, sort_keys = True)
+
+
+def write_weeks(weekly, offset = 0, weeks = None):
+    """
+    weekly is indexed by province, health_region, date_report
+    writes it to weekly_ts.csv ordered by week, from byte offset on (the rows before it are kept)
+    weeks is the offset of each week before offset
+    returns the byte offset of every week in the file, YYYY-MM-DD: offset
+    """
+    weekly = weekly.sort_index(level = ['date_report', 'province', 'health_region'])
+    weeks = {w: o for w, o in (weeks or {}).items() if o < offset}
+
+    with open(store.path_for(paths.WEEKLY, 'csv'), 'r+b' if offset else 'wb') as f:
+        f.seek(offset)
+        f.truncate()
+        if not offset:
+            f.write((','.join(WEEKLY_COLUMNS) + '\n').encode())
+        for week, rows in weekly.groupby(level = 'date_report', sort = False):
+            weeks[week.strftime('%Y-%m-%d')] = f.tell()
+            f.write(rows.to_csv(header = False, date_format = '%Y-%m-%d').encode())
+    return weeks
+
+
+def append_weeks(buckets, state):
+    """
+    buckets are the recomputed weekly sums, indexed by province, health_region, date_report
+    replaces them in weekly_ts.csv, rewriting only the weeks from the first bucket on
+    returns the byte offset of every week in the file
+    """
+    path = store.path_for(paths.WEEKLY, 'csv')
+    first = buckets.index.get_level_values('date_report').min().strftime('%Y-%m-%d')
+    offset = min([o for w, o in state['weeks'].items() if w >= first] or [os.path.getsize(path)])
+
+    with open(path, 'rb') as f:
+        f.seek(offset)
+        tail = read_cases(f, header = None, names = WEEKLY_COLUMNS)
+    tail = tail.set_index(['province', 'health_region', 'date_report'])
+
+    tail = pd.concat([tail.drop(buckets.index, errors = 'ignore'), buckets])
+    return write_weeks(tail, offset, state['weeks'])
+
+
+def append_cases(daily, state):
+    """
+    daily is the full upstream time series with date_report converted
+    state is the output of load_state()
+    appends only rows newer than the last ingested date of their health region to daily_ts.csv
+    and recomputes only the weekly buckets those rows fall into: weekly_ts.csv is ordered by week,
+    only the weeks from the first touched one on are rewritten.
+    returns the number of appended rows
+    """
+    key = daily.province.astype(str) + '|' + daily.health_region.astype(str)
+    last = pd.to_datetime(key.map(state['last_report']))
+    new = daily.loc[last.isna() | (daily.date_report > last)]
+
+    if new.empty:
+        return 0
+
+    # append daily rows, continuing the index of the existing file
+    new = new.set_index(pd.RangeIndex(state['rows'], state['rows'] + len(new)))
+    store.write(new, paths.DAILY, append = True)
+
+    # weekly buckets touched by the new rows (on and after july 20, 2020)
+    weeks = new.assign(week = week_ending(new.date_report))[['province', 'health_region', 'week']].drop_duplicates()
+    touched = pd.merge(daily.assign(week = week_ending(daily.date_report)), weeks, on = ['province', 'health_region', 'week'])
+    touched = touched.loc[touched.date_report >= "2020-07-20"]
+
+    buckets = (touched.groupby(['province', 'health_region', 'week'], observed = True)[['cases', 'cumulative_cases']].sum()
+               .rename_axis(['province', 'health_region', 'date_report']))
+
+    if state.get('weeks') is not None and state.get('weekly_bytes') == os.path.getsize(store.path_for(paths.WEEKLY, 'csv')):
+        weeks = append_weeks(buckets, state)
+    else:
+        # streamed (ordered by region) or changed since the last call: ordered by week once
+        weekly = read_weekly(paths.WEEKLY).set_index(['province', 'health_region', 'date_report'])
+        weeks = write_weeks(pd.concat([weekly.drop(buckets.index, errors = 'ignore'), buckets]))
+
+    save_state(new, state['rows'] + len(new), state['last_report'], weeks)
+    return len(new)
+
+
+def stream_cases(chunksize):
+    """
+    chunksize is the number of upstream rows held in memory at a time
+    full rebuild that reads, resamples and writes chunk by chunk. The upstream file is
+    ordered by health region then date, so only the last (still open) weekly bucket of
+    a chunk is carried over to the next one; every other bucket is complete and written.
+    Rows follow the upstream order rather than being sorted by province.
+    """
+    keys = ['province', 'health_region', 'date_report']
+    carry = None
+    done = set()
+    latest = []
+    rows = 0
+
+    with store.Writer(paths.DAILY) as daily_out, store.Writer(paths.WEEKLY) as weekly_out:
+        for chunk in iter_upstream(local_path(SOURCE), chunksize):
+            daily_out.write(chunk)
+            rows += len(chunk)
+
+            regions = set(zip(chunk.province.astype(str), chunk.health_region.astype(str)))
+            if regions & done:
+                raise ValueError("Upstream rows are not grouped by health region, can't stream: {}".format(sorted(regions & done)))
+
+            latest.append(chunk.groupby(['province', 'health_region'], observed = True).date_report.max().reset_index())
+
+            # weekly sums of the chunk (on and after july 20, 2020), plus the bucket left open by the previous chunk
+            july20 = chunk.loc[chunk.date_report >= "2020-07-20"]
+            buckets = (july20.assign(date_report = week_ending(july20.date_report))
+                       .groupby(keys, observed = True)[['cases', 'cumulative_cases']].sum())
+            if carry is not None:
+                buckets = pd.concat([carry, buckets]).groupby(level = keys, sort = False).sum()
+
+            # the bucket of the chunk's last row may continue in the next chunk
+            last = chunk.iloc[-1]
+            open_key = (last.province, last.health_region, week_ending(chunk.date_report.iloc[-1:]).iloc[0])
+            is_open = buckets.index.isin([open_key])
+
+            carry = buckets.loc[is_open]
+            weekly_out.write(buckets.loc[~is_open])
+            done |= regions - {(str(last.province), str(last.health_region))}
+
+        if carry is not None:
+            weekly_out.write(carry)
+
+    latest = pd.concat(latest)
+    save_state(latest, rows)
+    return rows
+
+
+@cache.stage(reads = [lambda: paths.CASES_SOURCE],
+             writes = [lambda: store.path_for(paths.DAILY), lambda: store.path_for(paths.WEEKLY)])
+def update_cases(incremental = False, chunksize = None, processes = None):
+    """
+    incremental only appends rows newer than the last call (see data/ingest_state.json).
+    Falls back to a full rebuild on the first call, and with a columnar intermediate format
+    (parquet and feather files can't be appended to). Upstream revisions of rows
+    that were already ingested are only picked up by a full rebuild.
+    chunksize streams a full rebuild in bounded memory (see stream_cases)
+    processes resamples the provinces of a full rebuild in a process pool
+    returns the weekly time series handed to mergeHR (None when streamed or appended, mergeHR reads it from disk)
+    """
+    if chunksize:
+        print("Streaming case data in chunks of {} rows.".format(chunksize))
+        rows = stream_cases(chunksize)
+        print("Wrote {} daily rows.".format(rows))
+        print("Latest case data call: {}".format(dt.datetime.today().strftime("%Y-%m-%d")))
+        return None
+
+    # typed read, date_report converted in one vectorized pass
+    daily = read_upstream(open_source(SOURCE))
+
+    state = load_state() if incremental else None
+    if state is not None and store.resolve() != 'csv':
+        print("Only csv intermediates are appended to, rebuilding the {} files.".format(store.resolve()))
+        state = None
+
+    if state is not None:
+        print("Appending case data reported since the last call.")
+        added = append_cases(daily, state)
+        print("Appended {} new rows.".format(added))
+        weekly = None
+
+    else:
+        # only grab from July 20, 2020 onwards
+        print("Retaining everything on and after july 20, 2020.")
+        july20 = daily.loc[daily.date_report >= "2020-07-20"]
+
+        # resample to weekly & export (csv ordered by week, see append_cases)
+        weekly = weekly_sums_parallel(july20, processes) if processes else weekly_sums(july20)
+        if store.resolve() == 'csv':
+            weeks = write_weeks(weekly)
+        else:
+            store.write(weekly, paths.WEEKLY)
+            weeks = None
+        weekly = weekly.reset_index()
+
+        # export daily cases too
+        store.write(daily, paths.DAILY)
+        save_state(daily, len(daily), weeks = weeks)
 
-    # export daily cases too
-    daily.to_csv("data/daily_ts.csv")
-    
     # print latest update
     latest = dt.datetime.today().strftime("%Y-%m-%d")
-    return "Latest case data call: {}".format(latest)
+    print("Latest case data call: {}".format(latest))
+    return weekly
+
+# schedule.every().monday.do(update_cases, incremental = True)
 
-# schedule.every().monday.do(update_cases)
 
+if __name__ == '__main__':
+    import argparse
 
-print(update_cases())
+    parser = argparse.ArgumentParser(description = "Collect the health region case time series.")
+    parser.add_argument('--incremental', action = 'store_true', help = "only append rows reported since the last call")
+    parser.add_argument('--chunksize', type = int, help = "stream the full rebuild, this many rows at a time")
+    parser.add_argument('--processes', type = int, help = "resample the provinces in this many processes")
+    args = parser.parse_args()
 
+    update_cases(incremental = args.incremental, chunksize = args.chunksize, processes = args.processes)
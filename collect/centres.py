@@ -0,0 +1,99 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# Population centres file for wrangle/cases/popctrs.py (paths.POPCTRS_POINTS)
+#
+# Every 2016 census population centre with the POPCTRS_30.csv columns it can be given
+# (POPCTRRAuid, POPCTRRAname, PRuid, CMAuid, POPCTRRApop_2016) and its representative point
+# (POPCTRRArplat, POPCTRRArplong, NAD83), built from the Statistics Canada population centre
+# boundary file and the population counts of the 2016 census highlight tables. Both are fetched
+# through the HTTP cache (see common/fetch.py), so COVID_FETCH=offline replays a snapshot.
+#
+#   python centres.py
+#   python centres.py --boundaries lpc_000b16a_e.zip --counts T801.csv    # local copies
+
+import os
+import sys
+import argparse
+import pandas as pd
+import geopandas as gpd
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from common import instrument, paths
+from common.fetch import local_path
+
+
+# GeoSuite representative points are NAD83 latitude/longitude (see popctrs.POINTS_CRS)
+POINTS_CRS = 'EPSG:4269'
+
+
+def read_boundaries(source = None):
+    """
+    source is the population centre boundary file (a shapefile, zipped or not, local or remote)
+    returns one representative point per population centre
+    """
+    path = local_path(source or paths.CENTRES_BOUNDARY_SOURCE)
+    boundaries = gpd.read_file(path if path.endswith('.shp') else 'zip://' + path)
+
+    # a centre may be made of several parts
+    boundaries = boundaries.dissolve(by = 'PCUID', aggfunc = 'first', as_index = False)
+    points = boundaries.geometry.representative_point().to_crs(POINTS_CRS)
+
+    return pd.DataFrame({
+        'POPCTRRAuid': boundaries.PCUID.astype(int),
+        'POPCTRRAname': boundaries.PCNAME,
+        'PRuid': boundaries.PRUID.astype(int),
+        'CMAuid': pd.to_numeric(boundaries.CMAUID, errors = 'coerce').astype('Int64'),
+        'POPCTRRArplat': points.y.values,
+        'POPCTRRArplong': points.x.values,
+    })
+
+
+def read_counts(source = None):
+    """
+    source is the population centre highlight table of the 2016 census (csv, local or remote)
+    returns the 2016 population indexed by POPCTRRAuid
+    """
+    counts = pd.read_csv(local_path(source or paths.CENTRES_COUNTS_SOURCE), dtype = str, encoding = 'latin-1')
+    columns = {c.strip().lower(): c for c in counts.columns}
+    code = columns.get('geographic code')
+    population = next((c for k, c in columns.items() if k.startswith('population, 2016')), None)
+    if code is None or population is None:
+        raise ValueError("No 'Geographic code' and 'Population, 2016' columns in the population counts: {}".format(", ".join(counts.columns)))
+
+    # footnotes follow the table
+    uid = pd.to_numeric(counts[code], errors = 'coerce')
+    pop = pd.to_numeric(counts[population].str.replace(',', ''), errors = 'coerce')
+    kept = uid.notna() & pop.notna()
+    return pd.Series(pop[kept].astype(int).values, index = uid[kept].astype(int).values, name = 'POPCTRRApop_2016')
+
+
+@instrument.measured
+def collect_centres(boundaries = None, counts = None):
+    """
+    boundaries and counts are the sources (default: paths.CENTRES_BOUNDARY_SOURCE, paths.CENTRES_COUNTS_SOURCE)
+    writes and returns the population centres file
+    """
+    centres = read_boundaries(boundaries)
+    population = read_counts(counts)
+
+    centres['POPCTRRApop_2016'] = centres.POPCTRRAuid.map(population)
+    missing = centres.POPCTRRApop_2016.isna()
+    if missing.any():
+        print("No 2016 population for {} population centres, left out: {}".format(missing.sum(), ", ".join(centres.POPCTRRAname[missing])))
+    centres = centres.loc[~missing].astype({'POPCTRRApop_2016': int})
+    centres = centres.sort_values('POPCTRRApop_2016', ascending = False, kind = 'stable').reset_index(drop = True)
+
+    os.makedirs(os.path.dirname(paths.POPCTRS_POINTS), exist_ok = True)
+    print("Creating file: {} ({} population centres)".format(os.path.basename(paths.POPCTRS_POINTS), len(centres)))
+    centres.to_csv(paths.POPCTRS_POINTS, index = False)
+    return centres
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description = 'Build the population centres file located by wrangle/cases/popctrs.py.')
+    parser.add_argument('--boundaries', help = 'population centre boundary file (default: the Statistics Canada 2016 file)')
+    parser.add_argument('--counts', help = 'population centre counts (default: the 2016 census highlight table)')
+    args = parser.parse_args()
+
+    collect_centres(args.boundaries, args.counts)
@@ -0,0 +1,378 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# Content-hash stage cache
+#
+# A stage's key hashes its parameters, the bytes of the files and remote sources it reads,
+# and the keys of its upstream stages. When the key matches the last run, the stage's
+# output is loaded from .cache/stages instead of being recomputed.
+#
+# The stage decorator memoizes a stage callable on its own, for notebooks and repeated calls
+# outside the pipeline (e.g. top30 after mergeHR): the key hashes the values of the arguments,
+# the files the stage reads, its code (its module and the repository modules it imports) and the
+# settings it depends on. Results are kept in memory (the MEMORY_ENTRIES most recently used) and
+# pickled to .cache/memo (the most recently used, up to DISK_BYTES), and only reused while the
+# files the stage writes are still those it wrote. The pipeline leaves memoized stages to it,
+# they are not stored in .cache/stages as well.
+# Geometry handed out by a memoized stage is keyed on that stage's key when it is passed on (e.g.
+# the levels of simplify_geometry to top30), not on its vertices; files are only hashed again
+# when their size or modification time changed, and the code of a stage is read once per process.
+# COVID_MEMO=memory keeps them in memory only, COVID_MEMO=off always runs the stage.
+
+import os
+import ast
+import json
+import time
+import pickle
+import weakref
+import hashlib
+import inspect
+import functools
+import datetime as dt
+import pandas as pd
+from collections import OrderedDict
+
+from common import instrument, paths
+from common.fetch import local_path
+
+
+STAGES = os.path.join(paths.ROOT, '.cache', 'stages')
+
+SHAPEFILE_PARTS = ['.shp', '.shx', '.dbf', '.prj', '.cpg']
+
+# sha256 of the files hashed by this process, with the size and modification time of their parts
+_digests = {}
+
+
+def fingerprint(source):
+    """
+    source is a local file or a url (its copy in the HTTP cache is hashed)
+    returns the sha256 of its bytes (all parts for a shapefile), or '' when the file is missing
+    """
+    h = hashlib.sha256()
+
+    if source.startswith('http'):
+        source = local_path(source)
+
+    stem, ext = os.path.splitext(source)
+    parts = [stem + e for e in SHAPEFILE_PARTS] if ext == '.shp' else [source]
+    parts = [p for p in parts if os.path.exists(p)]
+    if not parts:
+        return ''
+
+    stats = [(p, os.stat(p).st_size, os.stat(p).st_mtime_ns) for p in parts]
+    if source in _digests and _digests[source][0] == stats:
+        return _digests[source][1]
+
+    for p in parts:
+        with open(p, 'rb') as f:
+            for block in iter(lambda: f.read(1 << 20), b''):
+                h.update(block)
+    _digests[source] = stats, h.hexdigest()
+    return h.hexdigest()
+
+
+# the code of the repository (paths.ROOT may point elsewhere, e.g. a bench workspace)
+CODE = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CODE_DIRS = ['common', 'collect', 'wrangle/cases', 'wrangle/interventions', 'wrangle/summary']
+
+
+def imported(path):
+    """
+    returns the files of the repository modules imported by the python file path
+    (scripts import their neighbours by name, see the sys.path lines)
+    """
+    with open(path) as f:
+        tree = ast.parse(f.read(), path)
+
+    names = []
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Import):
+            names += [a.name for a in node.names]
+        elif isinstance(node, ast.ImportFrom) and node.module and not node.level:
+            names += [node.module] + ['{}.{}'.format(node.module, a.name) for a in node.names]
+
+    directories = [os.path.dirname(path)] + [os.path.join(CODE, d) for d in CODE_DIRS]
+    found = []
+    for name in names:
+        relative = name.replace('.', os.sep) + '.py'
+        candidates = [os.path.join(CODE, relative)] + [os.path.join(d, relative) for d in directories]
+        found += [c for c in candidates if os.path.exists(c)][:1]
+    return found
+
+
+@functools.lru_cache(maxsize = None)
+def code_files(path):
+    """
+    path is a python file of the repository
+    returns it and every repository module it imports, directly or through other modules
+    (read once per process, the code doesn't change during a run)
+    """
+    seen, todo = set(), [os.path.abspath(path)]
+    while todo:
+        f = todo.pop()
+        if f not in seen:
+            seen.add(f)
+            todo += [os.path.abspath(i) for i in imported(f)]
+    return tuple(sorted(seen))
+
+
+def stage_key(name, sources = (), params = None, upstream = ()):
+    """
+    name is the stage, sources the files/urls it reads, params its keyword arguments
+    upstream are the keys of the stages it depends on
+    """
+    h = hashlib.sha256()
+    h.update(name.encode())
+    h.update(json.dumps(params or {}, sort_keys = True, default = str).encode())
+    for s in sources:
+        h.update(fingerprint(s).encode())
+    for k in upstream:
+        h.update(k.encode())
+    return h.hexdigest()
+
+
+def load(name, key):
+    """
+    returns the cached output of the stage, or None when its last run had a different key
+    """
+    path = os.path.join(STAGES, name)
+    if not os.path.exists(path + '.key'):
+        return None
+
+    with open(path + '.key') as f:
+        if f.read() != key:
+            return None
+
+    return pd.read_pickle(path + '.pkl')
+
+
+def save(name, key, output):
+    """
+    keeps only the latest output of each stage
+    """
+    os.makedirs(STAGES, exist_ok = True)
+    path = os.path.join(STAGES, name)
+
+    pd.to_pickle(output, path + '.pkl')
+    with open(path + '.key', 'w') as f:
+        f.write(key)
+
+
+MEMO_MODES = ['on', 'memory', 'off']
+
+MEMORY_ENTRIES = 8
+DISK_BYTES = 1 << 30
+
+_memory = OrderedDict()
+_missing = object()
+
+# id of the geometry handed out by memoized stages -> (weak reference, stage key and position)
+_origins = {}
+
+
+def memo_mode():
+    m = os.environ.get('COVID_MEMO', 'on')
+    if m not in MEMO_MODES:
+        raise ValueError("Unknown COVID_MEMO mode {!r}, use one of {}".format(m, ', '.join(MEMO_MODES)))
+    return m
+
+
+def memo_dir():
+    return os.path.join(paths.ROOT, '.cache', 'memo')
+
+
+def produced(value, key):
+    """
+    records the GeoSeries and GeoDataFrames in value (the output of a memoized call with key)
+    so value_hash keys them on it (their copies are hashed by content, change a copy rather than the original)
+    """
+    def walk(v, at):
+        if isinstance(v, (tuple, list)):
+            for i, item in enumerate(v):
+                walk(item, '{}/{}'.format(at, i))
+        elif isinstance(v, dict):
+            for k, item in v.items():
+                walk(item, '{}/{}'.format(at, k))
+        elif isinstance(v, (pd.Series, pd.DataFrame)) and 'geometry' in [str(d) for d in (v.dtypes if isinstance(v, pd.DataFrame) else [v.dtype])]:
+            i = id(v)
+            _origins[i] = weakref.ref(v, lambda _: _origins.pop(i, None)), at
+    walk(value, key)
+
+
+def origin(value):
+    """
+    returns the stage key and position of geometry handed out by a memoized stage, None otherwise
+    """
+    found = _origins.get(id(value))
+    return found[1] if found is not None and found[0]() is value else None
+
+
+def value_hash(value):
+    """
+    returns the sha256 of an argument value: DataFrames, Series and GeoDataFrames by content
+    (geometry handed out by a memoized stage by its origin, see produced), tuples, lists and
+    dicts by their items, anything else by its pickle
+    """
+    h = hashlib.sha256()
+    source = origin(value)
+
+    if isinstance(value, pd.Series):
+        value = value.to_frame()
+
+    if isinstance(value, pd.DataFrame):
+        h.update(repr((type(value).__name__, [str(c) for c in value.columns], [str(d) for d in value.dtypes])).encode())
+        h.update(pd.util.hash_pandas_object(value.index).values.tobytes())
+        for i, dtype in enumerate(value.dtypes):
+            column = value.iloc[:, i]
+            if str(dtype) == 'geometry' and source is not None:
+                h.update(source.encode())
+            elif str(dtype) == 'geometry':
+                import shapely
+                for wkb in shapely.to_wkb(column.values):
+                    h.update(wkb or b'\0')
+            else:
+                try:
+                    h.update(pd.util.hash_pandas_object(column, index = False).values.tobytes())
+                except TypeError:
+                    h.update(pickle.dumps(column.tolist()))
+
+    elif isinstance(value, (tuple, list)):
+        h.update(type(value).__name__.encode())
+        for v in value:
+            h.update(value_hash(v).encode())
+
+    elif isinstance(value, dict):
+        for k in sorted(value, key = str):
+            h.update(str(k).encode())
+            h.update(value_hash(value[k]).encode())
+
+    else:
+        h.update(pickle.dumps(value))
+
+    return h.hexdigest()
+
+
+def copied(value):
+    """
+    returns value with its DataFrames copied, so a caller changing them leaves the cached result alone
+    """
+    if isinstance(value, (pd.DataFrame, pd.Series)):
+        return value.copy()
+    if isinstance(value, (tuple, list)):
+        return type(value)(copied(v) for v in value)
+    if isinstance(value, dict):
+        return {k: copied(v) for k, v in value.items()}
+    return value
+
+
+def recall(name, key, mode):
+    """
+    returns the memoized result of the stage and the fingerprints of the files it wrote, or _missing
+    """
+    if (name, key) in _memory:
+        _memory.move_to_end((name, key))
+        return _memory[(name, key)]
+
+    path = os.path.join(memo_dir(), '{}-{}.pkl'.format(name, key))
+    if mode != 'on' or not os.path.exists(path):
+        return _missing
+
+    output = pd.read_pickle(path)
+    # the modification time orders the disk cache by last use
+    os.utime(path)
+    remember(name, key, *output, 'memory')
+    return output
+
+
+def remember(name, key, output, written, mode):
+    _memory[(name, key)] = copied(output), written
+    _memory.move_to_end((name, key))
+    while len(_memory) > MEMORY_ENTRIES:
+        _memory.popitem(last = False)
+
+    if mode != 'on':
+        return
+
+    os.makedirs(memo_dir(), exist_ok = True)
+    path = os.path.join(memo_dir(), '{}-{}.pkl'.format(name, key))
+    pd.to_pickle((output, written), path + '.tmp')
+    os.replace(path + '.tmp', path)
+
+    # least recently used first
+    entries = sorted((e for e in os.scandir(memo_dir()) if e.name.endswith('.pkl')), key = lambda e: e.stat().st_mtime)
+    total = sum(e.stat().st_size for e in entries)
+    for e in entries:
+        if total <= DISK_BYTES:
+            break
+        total -= e.stat().st_size
+        os.remove(e.path)
+
+
+class Memoized:
+
+    def __init__(self, fnc, reads = (), writes = (), environ = ()):
+        """
+        fnc is the stage callable, reads/writes are callables returning the files (or urls) it reads/writes
+        environ are the environment variables its output depends on
+        """
+        functools.update_wrapper(self, fnc)
+        self._fnc = fnc
+        self.name = fnc.__name__
+        self.reads = reads
+        self.writes = writes
+        self.environ = environ
+        self.signature = inspect.signature(fnc)
+
+    def key(self, args, kwargs):
+        bound = self.signature.bind(*args, **kwargs)
+        bound.apply_defaults()
+        params = {k: value_hash(v) for k, v in bound.arguments.items()}
+        params.update({e: os.environ.get(e) for e in self.environ})
+        return stage_key(self.name, list(code_files(inspect.getsourcefile(self._fnc))) + [f() for f in self.reads], params)
+
+    def written(self):
+        return {f(): fingerprint(f()) for f in self.writes}
+
+    def __call__(self, *args, **kwargs):
+        return self.call(args, kwargs)[0]
+
+    def run(self, *args, **kwargs):
+        """
+        runs the stage even when its result is memoized, and memoizes the new one
+        """
+        return self.call(args, kwargs, force = True)[0]
+
+    def call(self, args, kwargs, force = False):
+        """
+        returns the output of the stage and whether it was memoized
+        """
+        mode = memo_mode()
+        if mode == 'off':
+            return instrument.call(self.name, self._fnc, args, kwargs), False
+
+        start = time.perf_counter()
+        key = self.key(args, kwargs)
+        memo = _missing if force else recall(self.name, key, mode)
+
+        # the files written by the memoized call must not have been removed or overwritten since
+        if memo is _missing or memo[1] != self.written():
+            output = instrument.call(self.name, self._fnc, args, kwargs)
+            remember(self.name, key, output, self.written(), mode)
+            produced(output, key)
+            return output, False
+
+        print("Reusing the result of {} (same arguments and inputs).".format(self.name))
+        output = copied(memo[0])
+        instrument.write({'stage': self.name, 'started': dt.datetime.now(dt.timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ'),
+                          'pid': os.getpid(), 'status': 'memo', 'seconds': round(time.perf_counter() - start, 3),
+                          'rows_out': instrument.rows(output)})
+        produced(output, key)
+        return output, True
+
+
+def stage(reads = (), writes = (), environ = ()):
+    """
+    decorator memoizing a stage callable (see Memoized)
+    """
+    return lambda fnc: Memoized(fnc, reads, writes, environ)
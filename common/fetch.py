@@ -0,0 +1,168 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# Remote sources (upstream case time series, Ontario response framework)
+#
+# Downloads are kept in .cache/http with their ETag/Last-Modified headers. The next
+# run sends a conditional request and reads the body from disk when the server
+# answers 304 Not Modified. COVID_FETCH selects the mode:
+#   online (default)  conditional requests, the cached copy is used if the server can't be reached
+#   offline           no network, every source is replayed from the cache (e.g. a recorded snapshot)
+#   refresh           unconditional requests
+# COVID_HTTP_CACHE points at another cache directory, such as a snapshot written by snapshot().
+
+import io
+import os
+import gzip
+import json
+import shutil
+import hashlib
+import datetime as dt
+import urllib.error
+import urllib.request
+from functools import lru_cache
+
+from common import paths
+
+
+MODES = ['online', 'offline', 'refresh']
+
+# seconds without an answer (or without data while downloading) before the cached copy is used
+TIMEOUT = 60
+
+
+def mode():
+    m = os.environ.get('COVID_FETCH', 'online')
+    if m not in MODES:
+        raise ValueError("Unknown COVID_FETCH mode {!r}, use one of {}".format(m, ', '.join(MODES)))
+    return m
+
+
+def cache_dir():
+    return os.environ.get('COVID_HTTP_CACHE', os.path.join(paths.ROOT, '.cache', 'http'))
+
+
+def entry(url):
+    """
+    returns the paths of the cached body and headers of url
+    """
+    name = hashlib.sha256(url.encode()).hexdigest()[:20]
+    stem = os.path.join(cache_dir(), name)
+    return stem + '.body', stem + '.json'
+
+
+def read_meta(url):
+    body, meta = entry(url)
+    if not (os.path.exists(body) and os.path.exists(meta)):
+        return None
+    with open(meta) as f:
+        return json.load(f)
+
+
+def write_meta(url, meta):
+    _, path = entry(url)
+    with open(path + '.tmp', 'w') as f:
+        json.dump(meta, f, indent = 1)
+    os.replace(path + '.tmp', path)
+
+
+def download(url, meta):
+    """
+    requests url, conditionally when meta (the cached headers) is given
+    returns the new headers, or meta when the source is not modified
+    """
+    body, _ = entry(url)
+    request = urllib.request.Request(url, headers = {'Accept-Encoding': 'gzip'})
+    if meta is not None:
+        if meta.get('etag'):
+            request.add_header('If-None-Match', meta['etag'])
+        if meta.get('last_modified'):
+            request.add_header('If-Modified-Since', meta['last_modified'])
+
+    try:
+        response = urllib.request.urlopen(request, timeout = TIMEOUT)
+    except urllib.error.HTTPError as e:
+        if e.code == 304 and meta is not None:
+            return dict(meta, checked = now())
+        raise
+
+    with response:
+        stream = gzip.GzipFile(fileobj = response) if response.headers.get('Content-Encoding') == 'gzip' else response
+        # write aside and move, an interrupted download never replaces the cached copy
+        with open(body + '.tmp', 'wb') as f:
+            shutil.copyfileobj(stream, f, 1 << 20)
+        os.replace(body + '.tmp', body)
+
+        return {
+            'url': url,
+            'etag': response.headers.get('ETag'),
+            'last_modified': response.headers.get('Last-Modified'),
+            'fetched': now(),
+            'checked': now(),
+            'bytes': os.path.getsize(body),
+        }
+
+
+def now():
+    return dt.datetime.now(dt.timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ')
+
+
+@lru_cache(maxsize = None)
+def local_path(url):
+    """
+    url is a remote csv (or a local copy of it)
+    returns the path of a local copy, revalidated once per process
+    """
+    if not url.startswith('http'):
+        return url
+
+    body, _ = entry(url)
+    meta = read_meta(url)
+
+    if mode() == 'offline':
+        if meta is None:
+            raise FileNotFoundError("{} is not in the HTTP cache {} (COVID_FETCH=offline)".format(url, cache_dir()))
+        return body
+
+    os.makedirs(cache_dir(), exist_ok = True)
+    try:
+        meta = download(url, None if mode() == 'refresh' else meta)
+    except OSError as e:
+        # unreachable, timed out, reset or a server error: fall back to the cached copy (a 4xx is a wrong url, raise)
+        if meta is None or (isinstance(e, urllib.error.HTTPError) and e.code < 500):
+            raise
+        print("Could not reach {} ({}), using the copy fetched {}".format(url, getattr(e, 'reason', e), meta['fetched']))
+        return body
+
+    write_meta(url, meta)
+    return body
+
+
+@lru_cache(maxsize = None)
+def fetch(url):
+    """
+    url is a remote csv (or a local copy of it)
+    returns its bytes
+    """
+    with open(local_path(url), 'rb') as f:
+        return f.read()
+
+
+def open_source(url):
+    """
+    returns a file-like object for pd.read_csv
+    """
+    return io.BytesIO(fetch(url))
+
+
+def snapshot(urls, dest):
+    """
+    copies the cached copies of urls to dest, to be replayed with COVID_FETCH=offline COVID_HTTP_CACHE=dest
+    """
+    os.makedirs(dest, exist_ok = True)
+    for url in urls:
+        local_path(url)
+        for path in entry(url):
+            shutil.copy(path, dest)
+    return dest
+
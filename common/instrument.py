@@ -0,0 +1,196 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# Per-stage metrics
+#
+# Every stage call (update_cases, mergeHR, top30, the intervention scripts, ...) appends one
+# JSON line to .cache/metrics.jsonl:
+#   stage, started, pid, status (ok/error), seconds, cpu_seconds
+#   peak_rss_mb       peak resident memory during the stage (Linux; elsewhere the process peak so far)
+#   rows_in, rows_out rows of the DataFrames handed to the stage and returned by it
+#   bytes_read, bytes_written   bytes the process read and wrote during the stage, files and network (Linux)
+# COVID_METRICS points at another log, or turns it off with COVID_METRICS=off.
+# COVID_PROFILE=cprofile,tracemalloc also captures a profile of each stage in .cache/profiles
+# (<stage>-<time>.prof for snakeviz/pstats, <stage>-<time>.txt with the top allocation sites).
+#
+#   pd.read_json('.cache/metrics.jsonl', lines = True)
+
+import os
+import sys
+import json
+import time
+import cProfile
+import functools
+import tracemalloc
+import datetime as dt
+
+from common import paths
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+
+CAPTURES = ['cprofile', 'tracemalloc']
+
+TOP_ALLOCATIONS = 25
+
+# stages being measured, nested stages leave the peak and the profilers to the outermost one
+ACTIVE = []
+
+
+def log_path():
+    return os.environ.get('COVID_METRICS', os.path.join(paths.ROOT, '.cache', 'metrics.jsonl'))
+
+
+def captures():
+    wanted = [c.strip() for c in os.environ.get('COVID_PROFILE', '').split(',') if c.strip()]
+    unknown = set(wanted) - set(CAPTURES)
+    if unknown:
+        raise ValueError("Unknown COVID_PROFILE capture {}, use {}".format(', '.join(sorted(unknown)), ' or '.join(CAPTURES)))
+    return wanted
+
+
+def proc(name):
+    """
+    returns the fields of /proc/self/<name> as integers (empty when there is no /proc)
+    """
+    try:
+        with open('/proc/self/' + name) as f:
+            fields = [line.split(':', 1) for line in f if ':' in line]
+    except OSError:
+        return {}
+    return {k.strip(): int(v.split()[0]) for k, v in fields if v.split() and v.split()[0].isdigit()}
+
+
+def reset_peak():
+    """
+    resets the peak resident memory of the process (Linux), returns whether it could
+    """
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+        return True
+    except OSError:
+        return False
+
+
+def peak_rss_mb():
+    peak = proc('status').get('VmHWM')
+    if peak is not None:
+        return round(peak / 1024, 1)
+    if resource is None:
+        return None
+    # kilobytes on Linux, bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)
+
+
+def rows(value):
+    """
+    returns the rows of the DataFrames in value (a frame, or a tuple, list or dict of them), None when there are none
+    """
+    if hasattr(value, 'shape') and hasattr(value, 'columns'):
+        return len(value)
+    if isinstance(value, dict):
+        value = list(value.values())
+    if isinstance(value, (tuple, list)):
+        counts = [rows(v) for v in value]
+        counts = [c for c in counts if c is not None]
+        return sum(counts) if counts else None
+    return None
+
+
+def profile_stem(name, started):
+    directory = os.path.join(paths.ROOT, '.cache', 'profiles')
+    os.makedirs(directory, exist_ok = True)
+    return os.path.join(directory, '{}-{}'.format(name, started.strftime('%Y%m%dT%H%M%S')))
+
+
+def write(record):
+    path = log_path()
+    if path == 'off':
+        return
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok = True)
+    with open(path, 'a') as f:
+        f.write(json.dumps(record) + '\n')
+
+
+def call(name, fnc, args, kwargs):
+    """
+    runs fnc(*args, **kwargs) and logs its metrics as stage name
+    """
+    started = dt.datetime.now(dt.timezone.utc)
+    record = {'stage': name, 'started': started.strftime('%Y-%m-%dT%H:%M:%SZ'), 'pid': os.getpid()}
+
+    outermost = not ACTIVE
+    wanted = captures() if outermost else []
+    record['peak_scope'] = 'stage' if outermost and reset_peak() else 'process'
+
+    profiler = cProfile.Profile() if 'cprofile' in wanted else None
+    tracing = 'tracemalloc' in wanted and not tracemalloc.is_tracing()
+    if tracing:
+        tracemalloc.start(10)
+
+    ACTIVE.append(name)
+    io = proc('io')
+    wall, cpu = time.perf_counter(), time.process_time()
+    output, status = None, 'ok'
+
+    try:
+        if profiler:
+            profiler.enable()
+        output = fnc(*args, **kwargs)
+        return output
+
+    except BaseException as e:
+        status = 'error'
+        record['error'] = repr(e)
+        raise
+
+    finally:
+        if profiler:
+            profiler.disable()
+        if tracing:
+            traced_peak = tracemalloc.get_traced_memory()[1]
+            snapshot = tracemalloc.take_snapshot().filter_traces([
+                tracemalloc.Filter(False, cProfile.__file__), tracemalloc.Filter(False, tracemalloc.__file__)])
+            tracemalloc.stop()
+        ACTIVE.pop()
+
+        after = proc('io')
+        record.update({
+            'status': status,
+            'seconds': round(time.perf_counter() - wall, 3),
+            'cpu_seconds': round(time.process_time() - cpu, 3),
+            'peak_rss_mb': peak_rss_mb(),
+            'rows_in': rows(list(args) + list(kwargs.values())),
+            'rows_out': rows(output),
+            'bytes_read': after['rchar'] - io['rchar'] if 'rchar' in io else None,
+            'bytes_written': after['wchar'] - io['wchar'] if 'wchar' in io else None,
+        })
+
+        if profiler or tracing:
+            stem = profile_stem(name, started)
+        if profiler:
+            profiler.dump_stats(stem + '.prof')
+            record['profile'] = stem + '.prof'
+        if tracing:
+            record['traced_peak_mb'] = round(traced_peak / (1 << 20), 1)
+            top = snapshot.statistics('lineno')[:TOP_ALLOCATIONS]
+            with open(stem + '.txt', 'w') as f:
+                f.write('\n'.join(str(s) for s in top) + '\n')
+            record['allocations'] = stem + '.txt'
+
+        write(record)
+
+
+def measured(fnc):
+    """
+    decorator logging the metrics of every call of the stage fnc
+    """
+    @functools.wraps(fnc)
+    def stage(*args, **kwargs):
+        return call(fnc.__name__, fnc, args, kwargs)
+    return stage
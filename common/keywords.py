@@ -0,0 +1,99 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# Keyword tagger for the concordance dictionaries (industries-dict, popctrs-dict)
+#
+# A text gets a tag when one of the tag's keywords is a substring of the lowercased text,
+# as with x.lower().find(v) > -1. The keywords compile once into a single regex,
+# and a whole column is scanned in one pass.
+
+import re
+from bisect import bisect
+from functools import lru_cache
+from itertools import accumulate
+
+
+def as_items(dictionary):
+    """
+    dictionary maps tags to lists of keywords
+    returns it as a hashable tuple of (tag, tuple of keywords)
+    """
+    return tuple((k, tuple(v)) for k, v in dictionary.items())
+
+
+def trie_pattern(words):
+    """
+    regex matching the longest of words at a position, with the words merged on common prefixes
+    so the regex engine follows one branch per character instead of trying every word
+    """
+    trie = dict()
+    for w in words:
+        node = trie
+        for ch in w:
+            node = node.setdefault(ch, dict())
+        node[''] = dict()
+
+    def branch(node):
+        alternatives = [re.escape(ch) + branch(child) for ch, child in sorted(node.items()) if ch != '']
+        if not alternatives:
+            return ''
+        body = alternatives[0] if len(alternatives) == 1 else '(?:{})'.format('|'.join(alternatives))
+        # a word ends here: try the longer words first (greedy), fall back to this one
+        return '(?:{})?'.format(body) if '' in node else body
+
+    return branch(trie)
+
+
+@lru_cache(maxsize = 8)
+def compile_keywords(items):
+    """
+    items is a dictionary from as_items
+    returns one pattern finding every keyword in a lowercase text, the tags (and their keywords) found by each match,
+    and the tags found in every text (an empty keyword is found in any string)
+
+    at a given position the pattern matches the longest keyword, and the keywords also found there
+    are its prefixes: a match finds the keyword and all its prefixes
+    """
+    owners = dict()
+    always = dict()
+    for tag, keywords in items:
+        for v in keywords:
+            if v == '':
+                always[tag] = ('',)
+            # texts are lowercased, a keyword with capitals never matches
+            elif v == v.lower():
+                owners.setdefault(v, set()).add(tag)
+
+    found = dict()
+    for v in owners:
+        tags = dict()
+        for u in sorted(u for u in owners if v.startswith(u)):
+            for tag in owners[u]:
+                tags[tag] = tags.get(tag, ()) + (u,)
+        found[v] = tags
+
+    pattern = re.compile('(?=({}))'.format(trie_pattern(owners))) if owners else None
+    return pattern, found, always
+
+
+def find_keywords(texts, dictionary):
+    """
+    texts is a sequence of strings (other values are never tagged), dictionary maps tags to lists of keywords
+    returns, for every text, a dict of the tags found and the set of their keywords found in the text
+    """
+    pattern, found, always = compile_keywords(as_items(dictionary))
+
+    lowered = [x.lower() if isinstance(x, str) else '' for x in texts]
+    hits = [{tag: set(v) for tag, v in always.items()} if isinstance(x, str) else dict() for x in texts]
+
+    if pattern is not None and lowered:
+        # texts joined by a character no keyword contains, match positions give the text back
+        starts = list(accumulate([0] + [len(t) + 1 for t in lowered[:-1]]))
+        joined = '\x00'.join(lowered)
+
+        for m in pattern.finditer(joined):
+            row = hits[bisect(starts, m.start()) - 1]
+            for tag, keywords in found[m.group(1)].items():
+                row.setdefault(tag, set()).update(keywords)
+
+    return hits
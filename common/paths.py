@@ -0,0 +1,37 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# Repository locations and remote sources, so stages don't depend on the working directory
+
+import os
+
+
+CASES_SOURCE = 'https://raw.githubusercontent.com/ishaberry/Covid19Canada/master/timeseries_hr/cases_timeseries_hr.csv'
+ONTARIO_SOURCE = 'https://data.ontario.ca/dataset/cbb4d08c-4e56-4b07-9db6-48335241b88a/resource/ce9f043d-f0d4-40f0-9b96-4c8a83ded3f6/download/response_framework.csv'
+# Statistics Canada 2016 census: population centre boundaries and population counts (see collect/centres.py)
+CENTRES_BOUNDARY_SOURCE = 'https://www12.statcan.gc.ca/census-recensement/2011/geo/bound-limit/files-fichiers/2016/lpc_000b16a_e.zip'
+CENTRES_COUNTS_SOURCE = 'https://www12.statcan.gc.ca/census-recensement/2016/dp-pd/hlt-fst/pd-pl/Tables/CompFile.cfm?Lang=Eng&T=801&OFT=FULLCSV'
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+COLLECT_DATA = os.path.join(ROOT, 'collect', 'data')
+SHAPEFILES = os.path.join(ROOT, 'wrangle', 'data', 'shapefiles')
+INTERVENTIONS = os.path.join(ROOT, 'wrangle', 'data', 'interventions')
+VIZ_INPUT = os.path.join(ROOT, 'viz', 'CovidTimeline', 'data', 'input')
+SNAPSHOTS = os.path.join(ROOT, 'viz', 'CovidTimeline', 'data', 'snapshots')
+
+DAILY = os.path.join(COLLECT_DATA, 'daily_ts')
+WEEKLY = os.path.join(COLLECT_DATA, 'weekly_ts')
+HR_BOUNDARIES = os.path.join(COLLECT_DATA, 'hr_boundaries', 'RegionalHealthBoundaries.shp')
+POPCTRS = os.path.join(COLLECT_DATA, 'POPCTRS', 'POPCTRS_30.csv')
+POPCTRS_POINTS = os.path.join(COLLECT_DATA, 'POPCTRS', 'POPCTRS_points.csv')
+HR_GEOMETRY = os.path.join(SHAPEFILES, 'hr_geometry')
+HR_CASES = os.path.join(SHAPEFILES, 'hr_cases')
+HR_CROSSWALK = os.path.join(ROOT, 'wrangle', 'data', 'hr_crosswalk.csv')
+MASTER = os.path.join(INTERVENTIONS, 'master')
+STANDARDS = os.path.join(INTERVENTIONS, 'standardized-restrictions.xlsx')
+MANUAL = os.path.join(INTERVENTIONS, 'master_closures_openings.xlsx')
+CONCORDANCE = os.path.join(INTERVENTIONS, 'place-types-concordance.xlsx')
+SUMMARY_CUBE = os.path.join(VIZ_INPUT, 'summary_cube')
+TIMELINE = os.path.join(VIZ_INPUT, 'timeline')
+METRICS = os.path.join(VIZ_INPUT, 'case_metrics')
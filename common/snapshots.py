@@ -0,0 +1,240 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# Versioned store for the dated dashboard exports (cases_<date>.shp, InterventionScan_Processed_<date>.csv)
+#
+# Every release is split into content-defined chunks (boundaries picked by a rolling hash of the
+# bytes, so an inserted or changed row only changes the chunks around it) and each distinct chunk
+# is kept once, compressed, under data/snapshots/chunks. A release is a small json listing the
+# chunks of its files; manifest.json lists every release with its size and the bytes it added,
+# and the latest version of each release. Any version is rebuilt with restore(), so the dated
+# copies in data/input can be pruned once they are in the store (on request only, with
+# update/snapshots.py prune: the stages only commit their releases).
+#
+#   data/snapshots/manifest.json
+#   data/snapshots/releases/<name>/<version>.json
+#   data/snapshots/releases/<name>/LATEST
+#   data/snapshots/chunks/<sha256[:2]>/<sha256>
+
+import os
+import json
+import zlib
+import hashlib
+import datetime as dt
+import numpy as np
+
+from common import paths
+
+
+# rolling hash over WINDOW bytes, a boundary where its top BITS bits are 0: chunks of 1 KB on average,
+# between MIN_CHUNK and MAX_CHUNK (about the size of a row of cases_<date>.dbf, so a new week
+# only changes the chunks around the rows it adds)
+WINDOW = 48
+BITS = 10
+MIN_CHUNK = 256
+MAX_CHUNK = 8 << 10
+BLOCK = 1 << 20
+
+PRIME = 0x9e3779b97f4a7c15
+MODULUS = 1 << 64
+
+
+def root():
+    return paths.SNAPSHOTS
+
+
+def candidates(data):
+    """
+    returns the offsets (end of chunk) where the hash of the WINDOW bytes before is a boundary
+    hash(i) = sum of b[j] * PRIME^(i - j) over the window, mod 2^64, from prefix sums of b[j] * PRIME^-j
+    """
+    inverse = pow(PRIME, -1, MODULUS)
+    found = []
+
+    with np.errstate(over = 'ignore'):
+        for start in range(0, len(data), BLOCK):
+            lo = max(start - WINDOW + 1, 0)
+            block = np.frombuffer(data, np.uint8, count = min(start + BLOCK, len(data)) - lo, offset = lo).astype(np.uint64)
+            if len(block) < WINDOW:
+                continue
+
+            powers = np.cumprod(np.full(len(block), PRIME, dtype = np.uint64))
+            inverses = np.cumprod(np.full(len(block), inverse, dtype = np.uint64))
+            prefix = np.cumsum(block * inverses * np.uint64(PRIME))
+
+            # window ending at k (inclusive): prefix[k] - prefix[k - WINDOW]
+            end = np.arange(WINDOW - 1, len(block))
+            window = prefix[end] - np.concatenate([[np.uint64(0)], prefix[:len(block) - WINDOW]])
+            hashes = window * powers[end] * np.uint64(inverse)
+
+            hits = end[(hashes >> np.uint64(64 - BITS)) == 0] + lo + 1
+            found.append(hits[hits > start])
+
+    return np.concatenate(found).tolist() if found else []
+
+
+def chunk(data):
+    """
+    returns the content-defined chunks of data
+    """
+    cuts, last = [], 0
+    for c in candidates(data) + [len(data)]:
+        while c - last > MAX_CHUNK:
+            last += MAX_CHUNK
+            cuts.append(last)
+        if c - last >= MIN_CHUNK or c == len(data):
+            cuts.append(c)
+            last = c
+
+    starts = [0] + cuts[:-1]
+    return [data[a:b] for a, b in zip(starts, cuts) if b > a]
+
+
+def chunk_path(digest):
+    return os.path.join(root(), 'chunks', digest[:2], digest)
+
+
+def put_chunk(data):
+    """
+    returns the digest of the chunk and the bytes added to the store (0 when it was already there)
+    """
+    digest = hashlib.sha256(data).hexdigest()
+    path = chunk_path(digest)
+    if os.path.exists(path):
+        return digest, 0
+
+    os.makedirs(os.path.dirname(path), exist_ok = True)
+    compressed = zlib.compress(data, 6)
+    with open(path + '.tmp', 'wb') as f:
+        f.write(compressed)
+    os.replace(path + '.tmp', path)
+    return digest, len(compressed)
+
+
+def write_json(path, content):
+    os.makedirs(os.path.dirname(path), exist_ok = True)
+    with open(path + '.tmp', 'w') as f:
+        json.dump(content, f, indent = 1)
+    os.replace(path + '.tmp', path)
+
+
+def read_json(path, default = None):
+    if not os.path.exists(path):
+        return default
+    with open(path) as f:
+        return json.load(f)
+
+
+def manifest():
+    return read_json(os.path.join(root(), 'manifest.json'), {'releases': {}})
+
+
+def release_path(name, version):
+    return os.path.join(root(), 'releases', name, version + '.json')
+
+
+def sha256(path):
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            h.update(block)
+    return h.hexdigest()
+
+
+def commit(name, version, files):
+    """
+    name is the release (e.g. 'cases'), version its date, files the paths written for it
+    stores the files and makes version the latest; returns the manifest entry of the version
+    """
+    release = {'name': name, 'version': version, 'files': {}}
+    total, added = 0, 0
+
+    for path in files:
+        with open(path, 'rb') as f:
+            data = f.read()
+
+        digests = []
+        for piece in chunk(data):
+            digest, stored = put_chunk(piece)
+            digests.append(digest)
+            added += stored
+
+        release['files'][os.path.basename(path)] = {
+            'bytes': len(data), 'sha256': hashlib.sha256(data).hexdigest(), 'chunks': digests}
+        total += len(data)
+
+    write_json(release_path(name, version), release)
+
+    content = manifest()
+    entry = content['releases'].setdefault(name, {'latest': None, 'versions': {}})
+    entry['versions'][version] = {
+        'created': dt.datetime.now(dt.timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ'),
+        'files': sorted(release['files']),
+        'bytes': total,
+        'stored_bytes': added,
+    }
+    entry['latest'] = max(entry['versions'])
+    write_json(os.path.join(root(), 'manifest.json'), content)
+
+    with open(os.path.join(root(), 'releases', name, 'LATEST'), 'w') as f:
+        f.write(entry['latest'])
+
+    print("Snapshot {} {}: {:,} bytes, {:,} new in the store".format(name, version, total, added))
+    return entry['versions'][version]
+
+
+def versions(name):
+    return sorted(manifest()['releases'].get(name, {}).get('versions', {}))
+
+
+def latest(name):
+    return manifest()['releases'].get(name, {}).get('latest')
+
+
+def restore(name, version = None, dest = None):
+    """
+    rebuilds the files of a version (default: the latest) in dest (default: the dashboard inputs)
+    returns their paths
+    """
+    version = version or latest(name)
+    release = read_json(release_path(name, version))
+    if release is None:
+        raise KeyError("No snapshot {} {} in {}".format(name, version, root()))
+
+    dest = dest or paths.VIZ_INPUT
+    os.makedirs(dest, exist_ok = True)
+
+    restored = []
+    for filename, f in release['files'].items():
+        data = b''.join(zlib.decompress(open(chunk_path(d), 'rb').read()) for d in f['chunks'])
+        if hashlib.sha256(data).hexdigest() != f['sha256']:
+            raise ValueError("Snapshot {} {} is corrupt: {} does not match its checksum".format(name, version, filename))
+
+        path = os.path.join(dest, filename)
+        with open(path, 'wb') as out:
+            out.write(data)
+        restored.append(path)
+    return restored
+
+
+def prune(name, directory = None):
+    """
+    removes the dated copies of the release in directory (default: the dashboard inputs)
+    that are stored byte for byte, except those of the latest version
+    returns the removed paths
+    """
+    directory = directory or paths.VIZ_INPUT
+    newest = latest(name)
+    removed = []
+
+    for version in versions(name):
+        if version == newest:
+            continue
+        release = read_json(release_path(name, version))
+        for filename, f in release['files'].items():
+            path = os.path.join(directory, filename)
+            if os.path.exists(path) and os.path.getsize(path) == f['bytes'] and sha256(path) == f['sha256']:
+                os.remove(path)
+                removed.append(path)
+    return removed
+
@@ -0,0 +1,184 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# Intermediate store for the hand-offs between pipeline stages
+#
+# csv (default): csv for tables, shapefile for geometry, same files as before
+# parquet / feather: columnar files (GeoParquet / GeoArrow for geometry), dtypes survive the round trip
+#
+# Pick the format with the COVID_INTERMEDIATE_FORMAT environment variable or the fmt argument.
+# Final exports (cases_<date>.shp, InterventionScan_Processed_<date>.csv) are not stored here.
+
+import os
+import pandas as pd
+
+
+FORMATS = ['csv', 'parquet', 'feather']
+FORMAT = os.environ.get('COVID_INTERMEDIATE_FORMAT', 'csv')
+
+EXTENSIONS = {'csv': '.csv', 'parquet': '.parquet', 'feather': '.feather'}
+GEO_EXTENSIONS = {'csv': '.shp', 'parquet': '.parquet', 'feather': '.feather'}
+
+
+def resolve(fmt = None):
+    fmt = fmt or FORMAT
+    if fmt not in FORMATS:
+        raise ValueError("Unknown intermediate format: {} (expected one of {})".format(fmt, ", ".join(FORMATS)))
+    return fmt
+
+
+def path_for(stem, fmt = None, geo = False):
+    """
+    stem is the path of the intermediate without extension, e.g. 'data/weekly_ts'
+    """
+    fmt = resolve(fmt)
+    return stem + (GEO_EXTENSIONS if geo else EXTENSIONS)[fmt]
+
+
+def exists(stem, fmt = None, geo = False):
+    return os.path.exists(path_for(stem, fmt, geo))
+
+
+def write(df, stem, fmt = None, append = False, index = True):
+    """
+    df is the DataFrame handed to the next stage
+    append adds rows to the end of an existing file (csv only: parquet and feather files can't be
+    appended to without rewriting them, see Writer to write them in parts)
+    index keeps the index: csv writes it as the leading column(s), columnar formats
+    store named levels as columns and an unnamed index as 'index'
+    """
+    fmt = resolve(fmt)
+    path = path_for(stem, fmt)
+
+    if fmt == 'csv':
+        df.to_csv(path, mode = 'a' if append else 'w', header = not append, index = index)
+        return path
+
+    if append:
+        raise ValueError("Only csv intermediates can be appended to, not {}".format(fmt))
+
+    df = df.reset_index(drop = not index)
+
+    if fmt == 'parquet':
+        df.to_parquet(path, index = False)
+    else:
+        df.to_feather(path)
+
+    return path
+
+
+def read(stem, fmt = None, **kwargs):
+    """
+    kwargs are passed to pd.read_csv (csv only; pass index_col = 0 to restore an unnamed index,
+    which columnar formats restore on their own)
+    """
+    fmt = resolve(fmt)
+    path = path_for(stem, fmt)
+
+    if fmt == 'csv':
+        return pd.read_csv(path, **kwargs)
+
+    df = pd.read_parquet(path) if fmt == 'parquet' else pd.read_feather(path)
+
+    if 'index' in df.columns:
+        df = df.set_index('index').rename_axis(None)
+    return df
+
+
+class Writer:
+    """
+    writes a table chunk by chunk, without holding it in memory
+    (csv appends, Parquet row groups, Arrow IPC record batches for Feather)
+
+    with store.Writer(stem) as out:
+        for chunk in chunks:
+            out.write(chunk)
+    """
+
+    def __init__(self, stem, fmt = None, index = True):
+        self.fmt = resolve(fmt)
+        self.path = path_for(stem, self.fmt)
+        self.index = index
+        self._writer = None
+        self._schema = None
+        self._started = False
+
+    def write(self, df):
+        if self.fmt == 'csv':
+            df.to_csv(self.path, mode = 'a' if self._started else 'w', header = not self._started, index = self.index)
+            self._started = True
+            return
+
+        import pyarrow as pa
+
+        table = pa.Table.from_pandas(df.reset_index(drop = not self.index), preserve_index = False)
+
+        if self._writer is None:
+            # categories vary by chunk, keep plain strings so every chunk has the same schema
+            self._schema = pa.schema([
+                pa.field(f.name, f.type.value_type) if pa.types.is_dictionary(f.type) else f
+                for f in table.schema])
+
+            if self.fmt == 'parquet':
+                import pyarrow.parquet as pq
+                self._writer = pq.ParquetWriter(self.path, self._schema)
+            else:
+                self._writer = pa.ipc.new_file(self.path, self._schema)
+
+        self._writer.write_table(table.cast(self._schema))
+        self._started = True
+
+    def close(self):
+        if self._writer is not None:
+            self._writer.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def write_geo(gdf, stem, fmt = None):
+    """
+    gdf is a GeoDataFrame handed to the next stage
+    """
+    fmt = resolve(fmt)
+    path = path_for(stem, fmt, geo = True)
+
+    if fmt == 'csv':
+        shapefile_ready(gdf).to_file(path)
+    elif fmt == 'parquet':
+        gdf.to_parquet(path)
+    else:
+        gdf.to_feather(path)
+
+    return path
+
+
+def read_geo(stem, fmt = None):
+    import geopandas as gpd
+
+    fmt = resolve(fmt)
+    path = path_for(stem, fmt, geo = True)
+
+    if fmt == 'csv':
+        return gpd.read_file(path)
+    elif fmt == 'parquet':
+        return gpd.read_parquet(path)
+    else:
+        return gpd.read_feather(path)
+
+
+def shapefile_ready(gdf):
+    """
+    shapefiles only hold plain strings and numbers:
+    categoricals become strings and dates are written as YYYY-MM-DD
+    """
+    gdf = gdf.copy()
+    for col in gdf.columns:
+        if isinstance(gdf[col].dtype, pd.CategoricalDtype):
+            gdf[col] = gdf[col].astype(str)
+        elif pd.api.types.is_datetime64_any_dtype(gdf[col]):
+            gdf[col] = gdf[col].dt.strftime('%Y-%m-%d')
+    return gdf
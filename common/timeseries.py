@@ -0,0 +1,79 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# Typed readers for the health region case time series
+#
+# Used by collect/cases.py (upstream + daily_ts.csv) and wrangle/cases/mergeHR.py (weekly_ts.csv)
+
+import pandas as pd
+
+from common import paths, store
+
+
+# province/health_region repeat on every row -> categorical
+# counts fit in int32 (cases can be negative after corrections)
+DTYPES = {
+    'province': 'category',
+    'health_region': 'category',
+    'cases': 'int32',
+    'cumulative_cases': 'int32'
+}
+
+UPSTREAM_FORMAT = '%d-%m-%Y'
+LOCAL_FORMAT = '%Y-%m-%d'
+
+
+def parse_dates(dates, fmt):
+    """
+    dates is a series of date strings
+    fmt is their strftime format, parsed in one vectorized pass
+    """
+    return pd.to_datetime(dates, format = fmt)
+
+
+def read_cases(path, fmt = LOCAL_FORMAT, **kwargs):
+    """
+    path is a case time series csv (local file or url)
+    fmt is the format of its date_report column
+    kwargs are passed to pd.read_csv
+    """
+    df = pd.read_csv(path, dtype = DTYPES, **kwargs)
+    df['date_report'] = parse_dates(df.date_report, fmt)
+    return df
+
+
+def read_upstream(path):
+    """
+    path is the cases_timeseries_hr.csv from the COVID-19 Canada Open Data Working Group
+    """
+    return read_cases(path, fmt = UPSTREAM_FORMAT)
+
+
+def iter_upstream(path, chunksize):
+    """
+    yields typed chunks of at most chunksize rows, streamed from path
+    (the index keeps counting across chunks)
+    """
+    for chunk in pd.read_csv(path, dtype = DTYPES, chunksize = chunksize):
+        chunk['date_report'] = parse_dates(chunk.date_report, UPSTREAM_FORMAT)
+        yield chunk
+
+
+def read_daily(stem = None, fmt = None):
+    """
+    stem is the intermediate without extension (default: collect/data/daily_ts), stored in fmt (see common/store.py)
+    """
+    stem = stem or paths.DAILY
+    if store.resolve(fmt) == 'csv':
+        return read_cases(store.path_for(stem, 'csv'), index_col = 0)
+    return store.read(stem, fmt).astype(DTYPES)
+
+
+def read_weekly(stem = None, fmt = None):
+    """
+    stem is the intermediate without extension (default: collect/data/weekly_ts), stored in fmt (see common/store.py)
+    """
+    stem = stem or paths.WEEKLY
+    if store.resolve(fmt) == 'csv':
+        return read_cases(store.path_for(stem, 'csv'))
+    return store.read(stem, fmt).astype(DTYPES)
@@ -0,0 +1,106 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# Excel reference data loader
+#
+# Parsed sheets are pickled to .cache/workbooks, one file per workbook, with the workbook's
+# mtime, size and sha256. A repeat run loads the pickle instead of parsing the workbook;
+# a touched but unchanged workbook is recognised by its hash. On a miss the workbook is
+# opened once and every reference sheet of it still missing is parsed in the same pass.
+
+import os
+import json
+import hashlib
+import threading
+import pandas as pd
+
+from common import paths
+
+
+_lock = threading.Lock()
+_loaded = dict()
+
+
+def cache_dir():
+    return os.path.join(paths.ROOT, '.cache', 'workbooks')
+
+
+def reference_sheets(path):
+    """
+    sheets parsed together whenever path has to be opened
+    """
+    return {
+        paths.CONCORDANCE: ['industries-dict', 'popctrs-dict'],
+        paths.STANDARDS: ['on'],
+    }.get(path, [])
+
+
+def sha256(path):
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            h.update(block)
+    return h.hexdigest()
+
+
+def sheet_key(sheet, kwargs):
+    return json.dumps([sheet, kwargs], sort_keys = True, default = str)
+
+
+def entry(path):
+    """
+    returns the cached sheets of path, emptied when the workbook changed
+    """
+    stat = os.stat(path)
+    signature = {'mtime': stat.st_mtime_ns, 'size': stat.st_size}
+
+    cached = _loaded.get(path)
+    pickled = os.path.join(cache_dir(), hashlib.sha256(path.encode()).hexdigest()[:20] + '.pkl')
+    if cached is None and os.path.exists(pickled):
+        cached = pd.read_pickle(pickled)
+
+    if cached is not None and dict(cached['signature']) != signature:
+        digest = sha256(path)
+        cached = dict(cached, signature = signature) if cached['sha256'] == digest else None
+
+    if cached is None:
+        cached = {'path': path, 'signature': signature, 'sha256': sha256(path), 'sheets': dict()}
+
+    cached['pickle'] = pickled
+    _loaded[path] = cached
+    return cached
+
+
+def read_sheets(path, sheets):
+    """
+    path is a workbook, sheets maps sheet names to read_excel keyword arguments (or is a list of names)
+    returns the sheets as DataFrames, parsed once per workbook version
+    """
+    if not isinstance(sheets, dict):
+        sheets = {s: {} for s in sheets}
+
+    with _lock:
+        cached = entry(path)
+        wanted = dict((sheet_key(s, kw), (s, kw)) for s, kw in sheets.items())
+        wanted.update((sheet_key(s, {}), (s, {})) for s in reference_sheets(path) if sheet_key(s, {}) not in cached['sheets'])
+        missing = {k: v for k, v in wanted.items() if k not in cached['sheets']}
+
+        if missing:
+            print("Parsing {} ({})".format(os.path.basename(path), ", ".join(s for s, _ in missing.values())))
+            with pd.ExcelFile(path) as workbook:
+                for k, (s, kw) in missing.items():
+                    cached['sheets'][k] = workbook.parse(s, **kw)
+
+            os.makedirs(cache_dir(), exist_ok = True)
+            pd.to_pickle({k: v for k, v in cached.items() if k != 'pickle'}, cached['pickle'] + '.tmp')
+            os.replace(cached['pickle'] + '.tmp', cached['pickle'])
+
+        # copies, callers rename and filter in place
+        return {s: cached['sheets'][sheet_key(s, kw)].copy() for s, kw in sheets.items()}
+
+
+def read_sheet(path, sheet, **kwargs):
+    """
+    cached pd.read_excel(path, sheet_name = sheet, **kwargs)
+    """
+    return read_sheets(path, {sheet: kwargs})[sheet]
@@ -0,0 +1,174 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# Backfill of the dated dashboard exports
+#
+# Rebuilds cases_<date>.shp and InterventionScan_Processed_<date>.csv for every date of a range,
+# as the pipeline would have written them that day: the daily case series is cut at the date
+# (the week in progress is summed up to it) and only the interventions implemented by then are kept
+# (undated ones are kept throughout). The dates are stored in the snapshot store, oldest first
+# (see common/snapshots.py); --prune then removes the older dated copies from data/input
+# (as update/snapshots.py prune does, never from a --dest directory).
+#
+# What every date shares is read once, in this process: the daily series, the crosswalk and
+# boundaries, the population centres, the simplified geometry and the tagged intervention table.
+# The dates are then written by a process pool whose workers inherit it when forked (the pages
+# are shared copy-on-write, nothing is pickled per date); elsewhere each worker receives it once.
+#
+#   python backfill.py 2021-01-04 2021-03-29                    # every day
+#   python backfill.py 2021-01-04 2021-03-29 --every 7          # Mondays only
+#   python backfill.py 2021-01-04 2021-03-29 --processes 4 --level medium --top 50
+#   python backfill.py 2021-01-04 2021-01-10 --dest /tmp/exports
+#   python backfill.py 2021-01-04 2021-03-29 --prune
+
+import os
+import sys
+import argparse
+import multiprocessing
+import pandas as pd
+from concurrent.futures import ProcessPoolExecutor
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '../wrangle/cases'))
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '../wrangle/interventions'))
+from common import paths, snapshots, store
+from common.resample import weekly_sums
+from common.timeseries import read_daily
+
+import mergeHR
+import normalize
+import simplify
+import top30
+import interventionsUpdate
+
+
+# the weekly series starts on this day (see collect/cases.py)
+FIRST = '2020-07-20'
+
+RELEASES = ['cases', 'interventions']
+
+# inputs shared by the dates, set by load() before the pool starts
+SHARED = {}
+
+
+def dates(start, end, every = 1):
+    """
+    returns the dates from start to end (inclusive) every `every` days, as YYYY-MM-DD
+    """
+    if pd.Timestamp(start) < pd.Timestamp(FIRST):
+        raise ValueError("The weekly series starts on {}, cannot backfill {}".format(FIRST, start))
+    return [d.strftime("%Y-%m-%d") for d in pd.date_range(start, end, freq = '{}D'.format(every))]
+
+
+def load(level = None, n = None, points = None):
+    """
+    reads and prepares the inputs every date shares
+    """
+    if not store.exists(paths.DAILY):
+        raise FileNotFoundError("No daily case series in {}, run update_cases first".format(os.path.dirname(paths.DAILY)))
+
+    daily = read_daily(paths.DAILY)
+    daily = daily.loc[daily.date_report >= FIRST]
+
+    print("Matching health regions.")
+    regions = mergeHR.provincial(daily[['province', 'health_region']].drop_duplicates())
+    crosswalk, rebuilt = normalize.crosswalk(regions, mergeHR.read_boundaries)
+    crosswalk = crosswalk.dropna(subset = ['HR_UID'])
+    geometry = mergeHR.write_geometry(crosswalk, rebuilt).rename(columns = {"Health Reg": "Health Region"})
+
+    # centres are located with the full boundaries, the exports may be simplified
+    centres = top30.centres(geometry, n, points)
+    geometry = simplify.at_level(geometry, level)
+
+    print("Tagging interventions.")
+    master = store.read(paths.MASTER, index_col = 0)
+    interv = interventionsUpdate.process(master, interventionsUpdate.industries_dict())
+    implemented = pd.to_datetime(interv.Implemented, format = 'ISO8601', errors = 'coerce')
+
+    return {'daily': daily, 'crosswalk': crosswalk, 'geometry': geometry, 'centres': centres, 'n': n,
+            'interventions': interv, 'implemented': implemented}
+
+
+def share(shared = None):
+    """
+    pool initializer, only handed the inputs when the workers are not forked
+    """
+    if shared is not None:
+        SHARED.update(shared)
+
+
+def build(date, dest = None):
+    """
+    writes the exports of date in dest (default: the dashboard inputs)
+    returns date and the files written per release
+    """
+    daily = SHARED['daily']
+    weekly = weekly_sums(daily.loc[daily.date_report <= date]).reset_index()
+    facts = mergeHR.case_facts(mergeHR.provincial(weekly), SHARED['crosswalk'])
+
+    final = top30.join_centres(SHARED['centres'], SHARED['geometry'], facts, SHARED['n'])
+    cases = top30.export(final, date, dest)
+
+    interv = SHARED['interventions'].loc[~(SHARED['implemented'] > date)]
+    interventions = interventionsUpdate.export(interv, date, dest)
+
+    return date, {'cases': cases, 'interventions': [interventions]}
+
+
+def backfill(start, end, every = 1, processes = None, level = None, n = None, points = None,
+             dest = None, force = False, prune = False):
+    """
+    rebuilds and stores the exports of the dates from start to end (see dates)
+    force rebuilds dates already in the snapshot store
+    prune removes the stored dated copies but the latest from the dashboard inputs (never from dest)
+    returns the dates built
+    """
+    todo = dates(start, end, every)
+    if not force:
+        stored = [set(snapshots.versions(name)) for name in RELEASES]
+        todo = [d for d in todo if not all(d in s for s in stored)]
+    if not todo:
+        print("Every date is in the snapshot store already (--force rebuilds them).")
+        return []
+
+    SHARED.update(load(level, n, points))
+    if dest:
+        os.makedirs(dest, exist_ok = True)
+
+    # forked workers inherit SHARED, the others get a pickled copy once each
+    forked = 'fork' in multiprocessing.get_all_start_methods()
+    context = multiprocessing.get_context('fork') if forked else None
+
+    print("Building {} dates from {} to {} ({} geometry).".format(len(todo), todo[0], todo[-1], simplify.resolve(level)))
+    with ProcessPoolExecutor(max_workers = processes, mp_context = context, initializer = share,
+                             initargs = () if forked else (dict(SHARED),)) as pool:
+        # results come back in date order, each is stored while the next ones are built
+        for date, files in pool.map(build, todo, [dest] * len(todo)):
+            for name in RELEASES:
+                snapshots.commit(name, date, files[name])
+
+    # the store's latest is the last daily run, pruning would empty dest
+    if prune and not dest:
+        for name in RELEASES:
+            removed = snapshots.prune(name)
+            if removed:
+                print("Removed {} older {} files (restore them with update/snapshots.py restore)".format(len(removed), name))
+    return todo
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description = 'Rebuild the dated dashboard exports of a range of dates.')
+    parser.add_argument('start', help = 'first date, YYYY-MM-DD')
+    parser.add_argument('end', help = 'last date, YYYY-MM-DD')
+    parser.add_argument('--every', type = int, default = 1, help = 'days between dates (default: 1)')
+    parser.add_argument('--processes', type = int, help = 'worker processes (default: one per CPU)')
+    parser.add_argument('--level', default = os.environ.get('COVID_GEOMETRY_LEVEL', 'full'),
+                        help = 'geometry level exported (see wrangle/cases/simplify.py)')
+    parser.add_argument('--top', type = int, help = 'number of population centres (default: 30)')
+    parser.add_argument('--dest', help = 'directory to write to (default: data/input)')
+    parser.add_argument('--force', action = 'store_true', help = 'rebuild dates already in the snapshot store')
+    parser.add_argument('--prune', action = 'store_true', help = 'then remove the stored dated copies from data/input, except the latest')
+
+    args = parser.parse_args()
+    backfill(args.start, args.end, args.every, args.processes, args.level, args.top,
+             dest = args.dest, force = args.force, prune = args.prune)
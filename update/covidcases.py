@@ -2,14 +2,11 @@
 # coding: utf-8
 # +
 import os
+import sys
 
-os.chdir("../collect/")
-os.system('python cases.py')
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from pipeline import run
 
-os.chdir("../wrangle/cases/")
-os.system('python mergeHR.py')
-os.system('python top30.py')
+run(['update_cases', 'mergeHR', 'top30'])
 
 # -
-
-
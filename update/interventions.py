@@ -3,7 +3,9 @@ import warnings
 warnings.filterwarnings('ignore')
 
 import os
-os.chdir("../wrangle/interventions/")
+import sys
 
-os.system('python interventionsMerge.py')
-os.system('python interventionsUpdate.py')
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from pipeline import run
+
+run(['interventionsMerge', 'interventionsUpdate'])
@@ -0,0 +1,161 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# In-process pipeline runner
+#
+# Runs the stages in one interpreter, in dependency order, handing DataFrames
+# from one stage to the next in memory. Each stage is keyed on the content of
+# the files and remote sources it reads, its code (its module and the repository
+# modules it imports), its parameters and its upstream keys (see common/cache.py):
+# when the key and the stage's outputs are unchanged, the cached output is reused
+# instead of running the stage. Memoized stages (update_cases, mergeHR,
+# simplify_geometry, top30) keep their results in their own cache (common/cache.py
+# stage), the pipeline reports them as memo when it is reused and does not store
+# them again.
+
+import os
+import sys
+import time
+import importlib
+import datetime as dt
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from common import cache, paths, store
+
+
+class Stage:
+
+    def __init__(self, name, module, after = None, inputs = (), outputs = ()):
+        """
+        name is the stage callable, defined in module (path relative to the repository code, cache.CODE)
+        after maps keyword arguments of the callable to the upstream stage providing them
+        inputs/outputs are callables returning the files (or urls) read/written by the stage
+        """
+        self.name = name
+        self.module = module
+        self.after = after or {}
+        self.inputs = inputs
+        self.outputs = outputs
+
+    def callable(self):
+        # the code is imported from the repository, paths.ROOT may point at another workspace (see Stage.key)
+        directory, module = os.path.split(self.module)
+        directory = os.path.join(cache.CODE, directory)
+        if directory not in sys.path:
+            sys.path.append(directory)
+        return getattr(importlib.import_module(module), self.name)
+
+    def key(self, params, upstream):
+        # the stage's module and the repository modules it imports are inputs too (e.g. the cleaning rules of normalize.py)
+        code = list(cache.code_files(os.path.join(cache.CODE, self.module + '.py')))
+        return cache.stage_key(self.name, [f() for f in self.inputs] + code,
+                               dict(params, format = store.resolve()), upstream)
+
+    def exported(self):
+        return all(os.path.exists(f()) for f in self.outputs)
+
+
+def today():
+    return dt.datetime.today().strftime("%Y-%m-%d")
+
+
+STAGES = [
+    Stage('update_cases', 'collect/cases',
+          inputs = [lambda: paths.CASES_SOURCE],
+          outputs = [lambda: store.path_for(paths.WEEKLY)]),
+    Stage('mergeHR', 'wrangle/cases/mergeHR',
+          after = {'weekly': 'update_cases'},
+          inputs = [lambda: paths.HR_BOUNDARIES],
+          outputs = [lambda: store.path_for(paths.HR_GEOMETRY, geo = True), lambda: store.path_for(paths.HR_CASES)]),
+    Stage('simplify_geometry', 'wrangle/cases/simplify',
+          inputs = [lambda: paths.HR_BOUNDARIES]),
+    Stage('top30', 'wrangle/cases/top30',
+          after = {'merged': 'mergeHR', 'simplified': 'simplify_geometry'},
+          inputs = [lambda: paths.POPCTRS, lambda: paths.POPCTRS_POINTS],
+          outputs = [lambda: os.path.join(paths.VIZ_INPUT, 'cases_{}.shp'.format(today()))]),
+    Stage('interventionsMerge', 'wrangle/interventions/interventionsMerge',
+          inputs = [lambda: paths.ONTARIO_SOURCE, lambda: paths.STANDARDS, lambda: paths.MANUAL],
+          outputs = [lambda: store.path_for(paths.MASTER)]),
+    Stage('interventionsUpdate', 'wrangle/interventions/interventionsUpdate',
+          after = {'master': 'interventionsMerge'},
+          inputs = [lambda: paths.CONCORDANCE],
+          outputs = [lambda: os.path.join(paths.VIZ_INPUT, 'InterventionScan_Processed_{}.csv'.format(today()))]),
+    Stage('caseMetrics', 'wrangle/summary/metrics',
+          after = {'merged': 'mergeHR'},
+          inputs = [lambda: store.path_for(paths.DAILY), lambda: paths.POPCTRS, lambda: paths.POPCTRS_POINTS],
+          outputs = [lambda: store.path_for(paths.METRICS, 'parquet')]),
+    Stage('summaryCube', 'wrangle/summary/cube',
+          after = {'merged': 'mergeHR', 'interventions': 'interventionsUpdate', 'metrics': 'caseMetrics'},
+          inputs = [lambda: paths.POPCTRS, lambda: paths.POPCTRS_POINTS],
+          outputs = [lambda: store.path_for(paths.SUMMARY_CUBE, 'parquet')]),
+    Stage('timelineIndex', 'wrangle/summary/timeline',
+          after = {'merged': 'mergeHR', 'interventions': 'interventionsUpdate'},
+          inputs = [lambda: paths.POPCTRS, lambda: paths.POPCTRS_POINTS],
+          outputs = [lambda t = t: store.path_for(paths.TIMELINE + '_' + t, 'parquet') for t in ['interventions', 'weeks', 'active']]),
+]
+
+
+def run(names = None, force = False, params = None):
+    """
+    names are the stages to run (default: all), upstream stages are added as needed
+    force runs every stage even when its key is unchanged
+    params maps stage names to extra keyword arguments, e.g. {'update_cases': {'incremental': True}}
+    returns the outputs of the stages, keyed by stage name
+    """
+    params = params or {}
+    stages = {s.name: s for s in STAGES}
+    wanted = set(names or stages)
+
+    # add upstream stages of the requested ones
+    todo = list(wanted)
+    while todo:
+        for upstream in stages[todo.pop()].after.values():
+            if upstream not in wanted:
+                wanted.add(upstream)
+                todo.append(upstream)
+
+    results, keys, timings = {}, {}, []
+
+    # STAGES is listed in dependency order
+    for stage in [s for s in STAGES if s.name in wanted]:
+        start = time.perf_counter()
+        kwargs = params.get(stage.name, {})
+        key = keys[stage.name] = stage.key(kwargs, [keys[u] for u in stage.after.values()])
+
+        function = stage.callable()
+
+        if isinstance(function, cache.Memoized):
+            kwargs = dict(kwargs, **{k: results[u] for k, u in stage.after.items()})
+            output, reused = function.call((), kwargs, force)
+            status = 'memo' if reused else 'ran'
+        else:
+            output = None if force or not stage.exported() else cache.load(stage.name, key)
+            if output is None:
+                kwargs = dict(kwargs, **{k: results[u] for k, u in stage.after.items()})
+                output = function(**kwargs)
+                cache.save(stage.name, key, output)
+                status = 'ran'
+            else:
+                status = 'cached'
+
+        results[stage.name] = output
+        timings.append((stage.name, status, time.perf_counter() - start))
+
+    print("\n{:<22}{:<10}{:>10}".format("Stage", "Status", "Seconds"))
+    for name, status, seconds in timings:
+        print("{:<22}{:<10}{:>10.2f}".format(name, status, seconds))
+
+    return results
+
+
+if __name__ == '__main__':
+    args = sys.argv[1:]
+    # --level=medium exports simplified geometry (see wrangle/cases/simplify.py)
+    # --top=50 exports the 50 largest population centres (see wrangle/cases/popctrs.py)
+    options = dict(a[2:].split('=', 1) for a in args if a.startswith('--') and '=' in a)
+    top = {'level': options.get('level', os.environ.get('COVID_GEOMETRY_LEVEL', 'full'))}
+    cube = {}
+    if 'top' in options:
+        top['n'] = cube['n'] = int(options['top'])
+    run([a for a in args if not a.startswith('--')] or None, force = '--force' in args,
+        params = {'update_cases': {'incremental': '--incremental' in args}, 'top30': top, 'caseMetrics': cube, 'summaryCube': cube, 'timelineIndex': cube})
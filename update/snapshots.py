@@ -0,0 +1,106 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# Snapshot store of the dated dashboard exports (see common/snapshots.py)
+#
+#   python snapshots.py list
+#   python snapshots.py restore cases 2021-02-15            # rebuilds cases_2021-02-15.* in data/input
+#   python snapshots.py restore interventions --dest /tmp    # latest release, elsewhere
+#   python snapshots.py import --prune                       # store the dated files already in data/input
+#   python snapshots.py prune cases                          # remove the stored dated files but the latest
+
+import os
+import re
+import sys
+import glob
+import argparse
+from collections import defaultdict
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from common import paths, snapshots
+
+
+# release name -> pattern of its dated files in data/input
+RELEASES = {
+    'cases': r'^cases_(\d{4}-\d{2}-\d{2})\.\w+$',
+    'interventions': r'^InterventionScan_Processed_(\d{4}-\d{2}-\d{2})\.csv$',
+}
+
+
+def dated_files(directory = None):
+    """
+    returns {name: {version: [paths]}} of the dated exports in directory (default: the dashboard inputs)
+    """
+    found = defaultdict(lambda: defaultdict(list))
+    for path in sorted(glob.glob(os.path.join(directory or paths.VIZ_INPUT, '*'))):
+        for name, pattern in RELEASES.items():
+            match = re.match(pattern, os.path.basename(path))
+            if match:
+                found[name][match.group(1)].append(path)
+    return found
+
+
+def list_releases():
+    content = snapshots.manifest()['releases']
+    for name, entry in sorted(content.items()):
+        total = sum(v['bytes'] for v in entry['versions'].values())
+        stored = sum(v['stored_bytes'] for v in entry['versions'].values())
+        print("{} ({} versions, latest {}): {:,} bytes in releases, {:,} stored".format(
+            name, len(entry['versions']), entry['latest'], total, stored))
+        for version, v in sorted(entry['versions'].items()):
+            print("  {}  {:>12,} bytes  {:>10,} new  {}".format(version, v['bytes'], v['stored_bytes'], ", ".join(v['files'])))
+
+
+def import_releases(prune = False):
+    """
+    stores the dated files of data/input, oldest first so each version only adds its changes
+    """
+    for name, found in sorted(dated_files().items()):
+        for version in sorted(found):
+            if version in snapshots.versions(name):
+                continue
+            snapshots.commit(name, version, found[version])
+        if prune:
+            prune_releases([name])
+
+
+def prune_releases(names = None, directory = None):
+    """
+    removes the dated files of data/input (or directory) stored byte for byte, except the latest version
+    """
+    for name in names or sorted(RELEASES):
+        removed = snapshots.prune(name, directory)
+        print("Removed {} older {} files (restore them with snapshots.py restore)".format(len(removed), name))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description = 'List, restore or import versions of the dated dashboard exports.')
+    commands = parser.add_subparsers(dest = 'command', required = True)
+
+    commands.add_parser('list', help = 'list the stored versions')
+
+    restore = commands.add_parser('restore', help = 'rebuild the files of a version')
+    restore.add_argument('name', choices = sorted(RELEASES))
+    restore.add_argument('version', nargs = '?', help = 'YYYY-MM-DD (default: latest)')
+    restore.add_argument('--dest', help = 'directory to write to (default: data/input)')
+
+    store = commands.add_parser('import', help = 'store the dated files already in data/input')
+    store.add_argument('--prune', action = 'store_true', help = 'then remove the stored files except the latest version')
+
+    prune = commands.add_parser('prune', help = 'remove the stored dated files except the latest version')
+    prune.add_argument('names', nargs = '*', help = 'releases to prune, {} (default: all)'.format(' or '.join(sorted(RELEASES))))
+    prune.add_argument('--dir', help = 'directory holding the dated files (default: data/input)')
+
+    args = parser.parse_args()
+    if args.command == 'list':
+        list_releases()
+    elif args.command == 'restore':
+        for path in snapshots.restore(args.name, args.version, args.dest):
+            print("Restored {}".format(path))
+    elif args.command == 'prune':
+        unknown = set(args.names) - set(RELEASES)
+        if unknown:
+            parser.error("unknown release {}, use {}".format(', '.join(sorted(unknown)), ' or '.join(sorted(RELEASES))))
+        prune_releases(args.names, args.dir)
+    else:
+        import_releases(args.prune)
@@ -0,0 +1,33 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# Refreshes the HTTP cache of the remote sources (see common/fetch.py), optionally recording a snapshot:
+#
+#   python sources.py --snapshot ../snapshots/2021-03-08
+#   COVID_FETCH=offline COVID_HTTP_CACHE=../snapshots/2021-03-08 python covidcases.py
+
+import os
+import sys
+import argparse
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from common import paths
+from common.fetch import local_path, read_meta, snapshot
+
+
+SOURCES = [paths.CASES_SOURCE, paths.ONTARIO_SOURCE, paths.CENTRES_BOUNDARY_SOURCE, paths.CENTRES_COUNTS_SOURCE]
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description = 'Refresh the HTTP cache of the remote sources, or record a snapshot of it.')
+    parser.add_argument('--snapshot', help = 'directory to copy the cached sources to')
+    args = parser.parse_args()
+
+    for url in SOURCES:
+        local_path(url)
+        meta = read_meta(url)
+        print("{}\n  etag {}  last modified {}  fetched {}  checked {}".format(
+            url, meta['etag'], meta['last_modified'], meta['fetched'], meta['checked']))
+
+    if args.snapshot:
+        print("Snapshot written to {}".format(snapshot(SOURCES, args.snapshot)))
@@ -0,0 +1,211 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# Health region name normalizer
+#
+# The cleaning rules that match the case file's health regions to RegionalHealthBoundaries,
+# compiled into a crosswalk of (province, health_region) -> clean_name, Health Region, HR_UID (as a string).
+# Rules run once per distinct name, and the crosswalk is saved to paths.HR_CROSSWALK,
+# rebuilt only when the rules, the boundary file or the set of case regions change.
+
+import os
+import sys
+import json
+import hashlib
+import pandas as pd
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '../..'))
+from common import cache, paths
+
+
+# Step 3 --- clean names to match
+# (replacements, regex) applied in order with Series.replace
+CASE_STEPS = [
+    ({r'\s\(.*\)': ''}, False),
+    ({',': '',
+      '-': ' '}, True),
+]
+
+# Step 3b --- fix ambiguities in case file
+# (province, clean_name) -> clean_name
+CASE_FIXUPS = {
+    ('Manitoba', 'Northern'): 'Northern Regional Health Authority',
+    ('BC', 'Northern'): 'Northern Health',
+
+    ('NL', 'Central'): 'Central Regional Health Authority',
+    ('Alberta', 'Central'): 'Central Zone',
+
+    ('Alberta', 'South'): 'South Zone',
+    ('Alberta', 'North'): 'North Zone',
+
+    ('NL', 'Eastern'): 'Eastern Regional Health Authority',
+    ('Ontario', 'Eastern'): 'The Eastern Ontario',
+
+    ('NL', 'Western'): 'Western Regional Health Authority',
+}
+
+# change health region name as well to differentiate
+# (province, clean_name) -> Health Region
+CASE_RENAMES = {
+    ('NL', 'Eastern Regional Health Authority'): 'Eastern Regional Health Authority',
+}
+
+# for health regions data
+HR_STEPS = [
+    ({
+        # General
+        'Région du ' : '',
+        'Région de la ' : '',
+        'Région des ' : '',
+        'Région de ' : '',
+        ' Regional Health Unit' : '',
+        ' Health Unit' : '',
+        'City of ' : '',
+        ',': '',
+        '-':' ',
+
+        # Specific
+        'Calgary Zone' : 'Calgary',
+        'Edmonton Zone' : 'Edmonton',
+        'Peterborough County–City': 'Peterborough',
+        'Vancouver  Coastal Health': 'Vancouver Coastal',
+        'Vancouver Island Health': 'Island',
+        'Interior Health' : 'Interior',
+        'Fraser Health':'Fraser',
+        'The District of Algoma': 'Algoma',
+        'Brant County': 'Brant',
+        ' District':'',
+        'Huron Perth Public':'Huron Perth',
+        'Sudbury and':'Sudbury',
+        'Niagara Regional Area':'Niagara',
+        'Southern Health—Santé Sud':'Southern Health',
+        'Renfrew County and':'Renfrew',
+        'Hastings and Prince Edward Counties':'Hastings Prince Edward',
+        'Prairie Mountain Health':'Prairie Mountain'
+    }, True),
+
+    ({
+        'Windsor Essex County':'Windsor Essex',
+        'Kingston Frontenac and Lennox and Addington':'Kingston Frontenac Lennox & Addington',
+        'Mauricie et du Centre du Québec':'Mauricie',
+        'Haliburton Kawartha Pine Ridge':'Haliburton Kawartha Pineridge',
+        'Gaspésie—Îles de la Madeleine':'Gaspésie Îles de la Madeleine',
+        'Saguenay—Lac Saint Jean':'Saguenay',
+        "l'Abitibi Témiscamingue":'Abitibi Témiscamingue',
+        "l'Estrie":'Estrie',
+        "l'Outaouais":'Outaouais',
+        'Interlake Eastern Regional Health Authority':'Interlake Eastern',
+        'Labrador Grenfell Regional Health Authority':'Labrador Grenfell',
+        'Winnipeg Regional Health Authority':'Winnipeg'
+    }, False),
+
+    # Step 3c --- aggregate zones in shapefile as was done by UofT researches in case ts
+    ({
+        # SK -- Far North
+        'Far North Central':'Far North',
+        'Far North East':'Far North',
+        'Far North West':'Far North',
+
+        # SK -- South
+        'South East':'South',
+        'South West':'South',
+        'South Central':'South',
+
+        # SK -- Central
+        'Central West':'Central',
+        'Central East':'Central',
+
+        # SK -- North
+        'North East':'North',
+        'North West':'North',
+        'North Central':'North'
+    }, False),
+]
+
+
+CROSSWALK = paths.HR_CROSSWALK
+
+
+def rules_hash():
+    rules = [CASE_STEPS, sorted(CASE_FIXUPS.items()), sorted(CASE_RENAMES.items()), HR_STEPS]
+    return hashlib.sha256(json.dumps(rules, ensure_ascii = False).encode()).hexdigest()
+
+
+def apply_steps(names, steps):
+    for replacements, regex in steps:
+        names = names.replace(replacements, regex = regex)
+    return names
+
+
+def clean_cases(regions):
+    """
+    regions is a DataFrame of distinct province, health_region
+    returns it with clean_name and Health Region (the health region name used in the outputs)
+    """
+    regions = regions.astype(str).reset_index(drop = True)
+    clean = apply_steps(regions.health_region, CASE_STEPS)
+
+    keys = list(zip(regions.province, clean))
+    regions['clean_name'] = [CASE_FIXUPS.get(k, c) for k, c in zip(keys, clean)]
+    regions['Health Region'] = [CASE_RENAMES.get((p, c), h) for p, c, h in
+                                zip(regions.province, regions.clean_name, regions.health_region)]
+    return regions
+
+
+def clean_boundaries(hr):
+    """
+    hr is RegionalHealthBoundaries
+    returns HR_UID and clean_name for every boundary
+    """
+    return pd.DataFrame({
+        'HR_UID': hr.HR_UID.astype(str),
+        'clean_name': apply_steps(hr.ENGNAME, HR_STEPS)
+    })
+
+
+def build(regions, hr):
+    """
+    regions is a DataFrame of distinct province, health_region from the case file
+    hr is RegionalHealthBoundaries
+    case regions without a boundary are kept with an empty HR_UID
+    """
+    cases = clean_cases(regions)
+    bounds = clean_boundaries(hr)
+    crosswalk = pd.merge(cases, bounds, on = 'clean_name', how = 'left')
+
+    # check missing names
+    hr_missing = list(set(bounds.clean_name) - set(cases.clean_name))
+    cases_missing = list(set(crosswalk.loc[crosswalk.HR_UID.isna(), 'clean_name']))
+
+    if len(hr_missing) > 3 or len(cases_missing) > 1:
+        print('Missing from HR: {}\nMissing from Cases: {}'.format(len(hr_missing), len(cases_missing)))
+        print(sorted(hr_missing), sorted(cases_missing))
+
+    return crosswalk
+
+
+def crosswalk(regions, read_boundaries):
+    """
+    regions is a DataFrame of distinct province, health_region from the case file
+    read_boundaries returns RegionalHealthBoundaries, only called when the crosswalk is rebuilt
+    returns the crosswalk and whether it was rebuilt
+    """
+    key = cache.stage_key('hr_crosswalk', [paths.HR_BOUNDARIES], {'rules': rules_hash()})
+
+    if os.path.exists(CROSSWALK) and os.path.exists(CROSSWALK + '.key'):
+        with open(CROSSWALK + '.key') as f:
+            current = f.read() == key
+
+        if current:
+            saved = pd.read_csv(CROSSWALK, dtype = str)
+            known = set(zip(saved.province, saved.health_region))
+            if set(zip(regions.province.astype(str), regions.health_region.astype(str))) <= known:
+                return saved, False
+
+    print("Building health region crosswalk.")
+    built = build(regions, read_boundaries())
+    built.to_csv(CROSSWALK, index = False)
+    with open(CROSSWALK + '.key', 'w') as f:
+        f.write(key)
+
+    return built, True
@@ -0,0 +1,131 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# Population centres and the health regions they are in
+#
+# POPCTRS_30.csv names the health region of each centre by hand. When the population centres
+# file (paths.POPCTRS_POINTS) is there, the N largest centres are instead located in the
+# health region geometry with a spatial index (point in polygon, nearest boundary for points
+# on the coast or a border), so adding centres is a matter of asking for more of them.
+#
+# POPCTRS_POINTS holds every population centre with the POPCTRS_30.csv columns and either
+# its representative point (POPCTRRArplat, POPCTRRArplong, as in the GeoSuite tables) or a
+# geometry (any file geopandas reads, polygons are reduced to a representative point).
+# collect/centres.py builds it from the Statistics Canada 2016 files. Without it the stages
+# fall back to POPCTRS_30.csv and say so.
+
+import os
+import sys
+import pandas as pd
+import geopandas as gpd
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '../..'))
+from common import paths
+
+
+# columns of POPCTRS_30.csv kept in the exports, in this order (create_rda.R selects by position)
+COLUMNS = ['POPCTRRAuid', 'POPCTRRAname', 'PRuid', 'CMAuid', 'Province', 'Health Region', 'health_reg_full']
+
+# Province as abbreviated in POPCTRS_30.csv, by PRuid
+PROVINCES = {
+    10: 'N.L.', 11: 'P.E.I.', 12: 'N.S.', 13: 'N.B.', 24: 'Que.', 35: 'Ont.',
+    46: 'Man.', 47: 'Sask.', 48: 'Alta.', 59: 'B.C.', 60: 'Y.T.', 61: 'N.W.T.', 62: 'Nvt.'
+}
+
+# GeoSuite representative points are NAD83 latitude/longitude
+POINTS_CRS = 'EPSG:4269'
+
+
+def read_points(path = None):
+    """
+    returns the population centres as a GeoDataFrame of points
+    """
+    path = path or paths.POPCTRS_POINTS
+    if path.endswith('.csv'):
+        centres = pd.read_csv(path)
+        return gpd.GeoDataFrame(centres, crs = POINTS_CRS,
+                                geometry = gpd.points_from_xy(centres.POPCTRRArplong, centres.POPCTRRArplat))
+
+    centres = gpd.read_file(path)
+    centres['geometry'] = centres.geometry.representative_point()
+    return centres
+
+
+def assign_regions(points, geometry):
+    """
+    points are population centres, geometry the health region geometry table (HR_UID, Health Region)
+    returns points with the HR_UID and Health Region of the boundary each is in
+    """
+    points = points.to_crs(geometry.crs) if points.crs is not None and geometry.crs is not None else points
+    points = points.reset_index(drop = True)
+    regions = geometry.reset_index(drop = True)
+
+    # point in polygon through the boundaries' STRtree; a point on a shared border keeps its first region
+    inside, region = regions.sindex.query(points.geometry, predicate = 'intersects')
+    found = pd.Series(region, index = inside)
+    found = found[~found.index.duplicated()]
+
+    # centres just outside every polygon (coastlines simplified away) go to the nearest one
+    outside = points.index.difference(found.index)
+    if len(outside):
+        near, region = regions.sindex.nearest(points.geometry.iloc[outside])
+        found = pd.concat([found, pd.Series(region, index = outside[near])])
+        found = found[~found.index.duplicated()]
+
+    # centres without a location stay without a region
+    at = found.reindex(points.index)
+    located = at.notna()
+    assigned = regions.iloc[at[located].astype(int)]
+    full = 'ENGNAME' if 'ENGNAME' in regions else 'Health Region'
+
+    for column, values in [('HR_UID', assigned.HR_UID), ('Health Region', assigned['Health Region']), ('health_reg_full', assigned[full])]:
+        points[column] = None
+        points.loc[located, column] = values.values
+    return points
+
+
+def population_centres(geometry, n = 30, points = None):
+    """
+    geometry is the health region geometry table, n the number of population centres kept
+    points is the population centres file (default: paths.POPCTRS_POINTS)
+    returns the n largest population centres (by 2016 population) with their health regions and HR_UID
+    """
+    centres = read_points(points)
+    centres = centres.nlargest(n, 'POPCTRRApop_2016', keep = 'first')
+    if 'Province' not in centres:
+        centres['Province'] = centres.PRuid.map(PROVINCES)
+
+    centres = assign_regions(centres, geometry)
+    missing = centres.loc[centres.HR_UID.isna(), 'POPCTRRAname']
+    if len(missing):
+        print("No health region for {} population centres: {}".format(len(missing), ", ".join(missing)))
+    return pd.DataFrame(centres[COLUMNS + ['HR_UID']]).reset_index(drop = True)
+
+
+def automated(points = None):
+    """
+    centres are assigned by location when the population centres file is there
+    """
+    found = os.path.exists(points or paths.POPCTRS_POINTS)
+    if not found:
+        print("Warning: no population centres file {}, the health regions of the centres are those named by hand in {} "
+              "(build it with python collect/centres.py)".format(points or paths.POPCTRS_POINTS, os.path.basename(paths.POPCTRS)))
+    return found
+
+
+def region_population(geometry, n = None, points = None):
+    """
+    geometry is the health region geometry table, n the number of population centres counted (default: all)
+    returns the 2016 population of the population centres in each health region, indexed by HR_UID
+    """
+    if automated(points):
+        centres = read_points(points)
+        centres = centres if n is None else centres.nlargest(n, 'POPCTRRApop_2016', keep = 'first')
+        centres = assign_regions(centres, geometry)
+    else:
+        centres = pd.read_csv(paths.POPCTRS)
+        centres = centres if n is None else centres.nlargest(n, 'POPCTRRApop_2016', keep = 'first')
+        regions = geometry.rename(columns = {"Health Reg": "Health Region"})[['HR_UID', 'Health Region']]
+        centres = pd.merge(centres, regions.astype({'HR_UID': str}), on = 'Health Region')
+
+    return centres.astype({'HR_UID': str}).groupby('HR_UID').POPCTRRApop_2016.sum()
@@ -0,0 +1,109 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# Simplified health region geometry for the dashboard
+#
+# RegionalHealthBoundaries is simplified once per level, and the levels are memoized as a stage
+# (see common/cache.py stage) against the boundary file and this code (the tolerances included),
+# so the simplification only reruns when the boundaries change. Regions are simplified together as a coverage: shared borders are
+# simplified once, so neighbouring regions keep meeting without gaps or overlaps.
+#
+# Levels (tolerance in metres):
+#   full      the original boundaries
+#   fine      100 m, indistinguishable at province zoom
+#   medium    500 m
+#   coarse    2.5 km, for the Canada-wide map
+#
+# Pick the level of the exports with the COVID_GEOMETRY_LEVEL environment variable or the level argument.
+#
+#   python simplify.py    # prepare every level and print their sizes
+
+import os
+import sys
+import geopandas as gpd
+import shapely
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '../..'))
+from common import cache, paths
+
+
+LEVELS = {'full': 0, 'fine': 100, 'medium': 500, 'coarse': 2500}
+LEVEL = os.environ.get('COVID_GEOMETRY_LEVEL', 'full')
+
+# metres per degree at the equator, for boundaries in a geographic CRS
+DEGREE = 111320
+
+
+def resolve(level = None):
+    level = level or LEVEL
+    if level not in LEVELS:
+        raise ValueError("Unknown geometry level: {} (expected one of {})".format(level, ", ".join(LEVELS)))
+    return level
+
+
+def tolerance(level, crs):
+    """
+    returns the tolerance of level in the units of crs
+    """
+    metres = LEVELS[level]
+    return metres / DEGREE if crs is not None and crs.is_geographic else metres
+
+
+def simplify(geometry, tol):
+    """
+    geometry is a GeoSeries of adjacent polygons
+    returns it simplified as a coverage (per polygon when shapely has no coverage_simplify)
+    """
+    if not tol:
+        return geometry
+    if hasattr(shapely, 'coverage_simplify'):
+        values = shapely.coverage_simplify(geometry.values, tol)
+        return gpd.GeoSeries(values, index = geometry.index, crs = geometry.crs)
+    return geometry.simplify(tol, preserve_topology = True)
+
+
+@cache.stage(reads = [lambda: paths.HR_BOUNDARIES])
+def simplify_geometry(boundaries = None):
+    """
+    boundaries is the health region boundary file (default: paths.HR_BOUNDARIES,
+    another file is memoized by its path only)
+    returns {level: GeoSeries of the boundaries indexed by HR_UID (as a string)}
+    """
+    boundaries = boundaries or paths.HR_BOUNDARIES
+
+    print("Simplifying health region geometry ({}).".format(", ".join(LEVELS)))
+    hr = gpd.read_file(boundaries)
+    full = hr.set_index(hr.HR_UID.astype(str)).geometry.rename_axis('HR_UID')
+
+    return {level: simplify(full, tolerance(level, full.crs)) for level in LEVELS}
+
+
+def at_level(geometry, level = None, simplified = None):
+    """
+    geometry is a GeoDataFrame with an HR_UID column (e.g. the geometry table from mergeHR)
+    simplified is the output of simplify_geometry (computed when not given)
+    returns geometry with its polygons replaced by those of level
+    """
+    level = resolve(level)
+    if level == 'full':
+        return geometry
+
+    simplified = simplified or simplify_geometry()
+    polygons = simplified[level]
+    replaced = geometry.HR_UID.astype(str).map(polygons)
+
+    replaced = gpd.GeoSeries(replaced.values, index = geometry.index, crs = polygons.crs)
+    if geometry.crs is not None and geometry.crs != polygons.crs:
+        replaced = replaced.to_crs(geometry.crs)
+
+    geometry = geometry.copy()
+    geometry['geometry'] = replaced
+    return geometry
+
+
+if __name__ == '__main__':
+    simplified = simplify_geometry()
+
+    print("\n{:<10}{:>12}{:>14}".format("Level", "Tolerance", "Vertices"))
+    for level, polygons in simplified.items():
+        print("{:<10}{:>10} m{:>14}".format(level, LEVELS[level], shapely.get_num_coordinates(polygons.values).sum()))
@@ -3,56 +3,114 @@
 
 # Filter COVID-19 shape data to only contain top 30 Population Centres
 
+import os
+import sys
 import geopandas as gpd
 import pandas as pd
 import datetime as dt
 
-class PopCentres:
-    
-    def __init__(self, fnc):
-        
-        self._fnc = fnc
-        
-    def __call__(self, *args, **kwargs):
-        
-        return self._fnc(*args, **kwargs)
-
-
-@PopCentres
-def top30():
-    shp = gpd.read_file('../../wrangle/data/shapefiles/mergedHR.shp')
-    shp.rename(columns = {
-        "Health Reg": "Health Region"
-    }, inplace = True)
-    popcen = pd.read_csv('../../collect/data/POPCTRS/POPCTRS_30.csv')
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '../..'))
+from common import cache, paths, snapshots, store
+
+import popctrs
+import simplify
+
+
+def centres(geometry, n = None, points = None):
+    """
+    geometry is the health region geometry table (full boundaries)
+    returns the n largest population centres (default: 30) with their health regions
+    """
+    if popctrs.automated(points):
+        print("Locating the {} largest population centres in the health regions.".format(n or 30))
+        return popctrs.population_centres(geometry, n or 30, points)
 
+    popcen = pd.read_csv(paths.POPCTRS)
+    if n is not None:
+        popcen = popcen.nlargest(n, 'POPCTRRApop_2016', keep = 'first')
 
     # drop unneccessary columns from population centre csv
-    popcen_short = popcen.drop(columns = ['POPCTRRAtype', 'POPCTRRAtdwell_2016', 'POPCTRRAurdwell_2016', 'POPCTRRApop_2011',
+    return popcen.drop(columns = ['POPCTRRAtype', 'POPCTRRAtdwell_2016', 'POPCTRRAurdwell_2016', 'POPCTRRApop_2011',
            'POPCTRRApop_2011a', 'POPCTRRAtdwell_2011a', 'POPCTRRAurdwell_2011a',
            'POPCTRRAarea', 'POPCTRRAadj_2011', 'POPCTRRAir_2011',
            'POPCTRRAir_2016', 'POPCTRRclass', 'POPCTRRApop_2016', 'XPRuid', 'unique'])
 
+
+def join_centres(popcen_short, geometry, facts, n = None):
+    """
+    popcen_short is the output of centres, geometry the (possibly simplified) geometry table, facts the weekly case facts
+    returns the population centres with the weekly cases and geometry of their health region
+    """
     # merge and retain only the top 30 population centres in the covid cases shapefile
-    merged = pd.merge(popcen_short, shp, on = 'Health Region', how = 'left')
+    # (geometry is joined per region first, then repeated over the weeks)
+    facts = facts.astype({'HR_UID': geometry.HR_UID.dtype})
+    shp = pd.merge(facts, geometry, on = 'HR_UID')
+    if 'HR_UID' in popcen_short:
+        # located centres: by boundary, names repeat across provinces (Central, North, ...)
+        popcen_short = popcen_short.astype({'HR_UID': geometry.HR_UID.dtype})
+        merged = pd.merge(popcen_short, shp.drop(columns = 'Health Region'), on = 'HR_UID', how = 'left', suffixes = ('', '_2'))
+    else:
+        merged = pd.merge(popcen_short, shp, on = 'Health Region', how = 'left', suffixes = ('', '_2'))
     
     
     
     # CHECK: HOW MANY POPCTRS WERE INCLUDED
         # There are 31 because I accidentally included Red Deer in the reference file but why not?
-    if len(merged.POPCTRRAname.unique())  < 30:
+    if len(merged.POPCTRRAname.unique())  < (n or 30):
         print("Only retained: {} Pop Centres - \n {}".format(len(merged.POPCTRRAname.unique()), merged.POPCTRRAname.unique()))
 
-        
-        
+    return gpd.GeoDataFrame(merged, geometry='geometry', crs = geometry.crs)
+
+
+def export(final, date, directory = None):
+    """
+    writes final as cases_<date>.shp in directory (default: the dashboard inputs)
+    returns the files written
+    """
+    stem = os.path.join(directory or paths.VIZ_INPUT, 'cases_{}'.format(date))
+    store.shapefile_ready(final).to_file(stem + '.shp')
+    return [stem + e for e in cache.SHAPEFILE_PARTS if os.path.exists(stem + e)]
+
+
+@cache.stage(reads = [lambda: store.path_for(paths.HR_GEOMETRY, geo = True), lambda: store.path_for(paths.HR_CASES),
+                      lambda: paths.POPCTRS, lambda: paths.POPCTRS_POINTS],
+             writes = [lambda: os.path.join(paths.VIZ_INPUT, 'cases_{}.shp'.format(dt.datetime.today().strftime("%Y-%m-%d")))],
+             environ = ['COVID_GEOMETRY_LEVEL'])
+def top30(merged = None, simplified = None, level = None, n = None, points = None):
+    """
+    merged is the health region geometry and weekly case facts from mergeHR
+    (read from wrangle/data/shapefiles when not given)
+    simplified is the output of simplify_geometry, level the geometry level exported (see simplify.py)
+    n is the number of population centres (default: 30), points the population centres file:
+    when it exists centres are located in the health regions (see popctrs.py), otherwise
+    the health regions of POPCTRS_30.csv are used
+    returns the exported GeoDataFrame
+    """
+    if merged is None:
+        merged = store.read_geo(paths.HR_GEOMETRY), store.read(paths.HR_CASES)
+    geometry, facts = merged
+
+    geometry = geometry.rename(columns = {
+        "Health Reg": "Health Region"
+    })
+
+    popcen_short = centres(geometry, n, points)
+
+    # centres are located with the full boundaries, the export may be simplified
+    geometry = simplify.at_level(geometry, level, simplified)
+
     # Convert and Export
-    final = gpd.GeoDataFrame(merged, geometry='geometry')
+    final = join_centres(popcen_short, geometry, facts, n)
 
     
     latest = dt.datetime.today().strftime("%Y-%m-%d")
-    print("Creating file: cases_{}.shp".format(latest))
-    
-    final.to_file('../../viz/CovidTimeline/data/input/cases_{}.shp'.format(latest))
+    print("Creating file: cases_{}.shp ({} geometry)".format(latest, simplify.resolve(level)))
+    files = export(final, latest)
+
+    # keep the release in the snapshot store (older dated copies are removed with update/snapshots.py prune)
+    snapshots.commit('cases', latest, files)
+    return final
 
-print(top30())
 
+if __name__ == '__main__':
+    top30()
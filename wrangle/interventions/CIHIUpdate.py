@@ -2,107 +2,210 @@
 # coding: utf-8
 
 # # Updating Master Intervention list with CIHI releases
+#
+# Regional/municipal interventions get their health regions from the popctrs-dict keywords.
+# Suggestions are written to a review file (suggested regions, confidence, matched keywords):
+#
+#   python CIHIUpdate.py --cutoff 2020-11-01 --batch              # write the review file, stop
+#   (fill in the approved column of the review file: yes/no, edit health_region if needed)
+#   python CIHIUpdate.py --cutoff 2020-11-01 --approved REVIEW    # export, no keystrokes
+#
+# Without --batch or --approved every suggestion is confirmed at the prompt.
+
+
+import os
+import sys
+import pandas as pd
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '../..'))
+from common import instrument, paths
+from common.keywords import find_keywords
+from common.workbooks import read_sheet
 
-import pandas as pd
-from collections import defaultdict
 
-old = pd.read_excel('../data/interventions/CIHI_closures_openings.xlsx', sheet_name = "top30")
-new = pd.read_excel("../data/interventions/covid-19-intervention-scan-data-tables-en-web.xlsx", sheet_name = "Intervention scan", skiprows = [0,1])
-popctrs = pd.read_csv('../../collect/data/POPCTRS/POPCTRS_30.csv')
+OLD = os.path.join(paths.INTERVENTIONS, 'CIHI_closures_openings.xlsx')
+RELEASE = os.path.join(paths.INTERVENTIONS, 'covid-19-intervention-scan-data-tables-en-web.xlsx')
+REVIEW = os.path.join(paths.INTERVENTIONS, 'CIHI_hr_review.csv')
+EXPORT = os.path.join(paths.INTERVENTIONS, 'InterventionScan_Nov.csv')
+
+# Filter provinces/territories that don't contain top30 POPCTRS
+keep = 'Ont.|Alta.|B.C.|Que.|N.S.|Sask.|N.L.|Man.|N.B.'
 
-# Filter for closures and openings only - after july 22
-new2 = new.loc[new['Intervention type'].str.contains("Closures|Openings")]
+REVIEW_COLUMNS = ['Entry ID', 'Jurisdiction', 'Date implemented', 'Intervention summary',
+                  'suggested', 'confidence', 'evidence', 'health_region', 'approved']
 
 
 # Step 1 --- Filter after (and including) last update
-cutoff = input("Enter the final date of the previous release (YYYY-MM-DD): ")
-new3 = new2.loc[new2['Date implemented'].astype(str) >= cutoff]
+def read_release(cutoff):
+    new = read_sheet(RELEASE, "Intervention scan", skiprows = [0,1])
+
+    # Filter for closures and openings only - after july 22
+    new2 = new.loc[new['Intervention type'].str.contains("Closures|Openings")]
+    new3 = new2.loc[new2['Date implemented'].astype(str) >= cutoff]
+
+    new4 = new3[new3.Jurisdiction.str.contains(keep,na=False)]
+    print("{} new entries for the top 30 POPCTRS since {}".format(len(new4), cutoff))
+    return new4
 
-    # Filter provinces/territories that don't contain top30 POPCTRS
-keep = 'Ont.|Alta.|B.C.|Que.|N.S.|Sask.|N.L.|Man.|N.B.'
-new4 = new3[new3.Jurisdiction.str.contains(keep,na=False)]
-print("{} new entries for the top 30 POPCTRS since {}".format(len(new4), cutoff))
 
 # Step 2 --- Make reference DataFrame
-d = popctrs.groupby(['Province', 'health_reg'])['health_reg'].count().to_dict()
-reference = pd.DataFrame(d, index =[0]).transpose().reset_index().drop(columns = [0])
-reference.columns = ['Jurisdiction', 'health_region']
+def reference_regions(popctrs):
+    """
+    returns the health regions of the top 30 POPCTRS and their jurisdiction
+    """
+    reference = popctrs[['Province', 'Health Region']].drop_duplicates().sort_values(['Province', 'Health Region'])
+    reference.columns = ['Jurisdiction', 'health_region']
+    return reference.reset_index(drop = True)
 
 
+# Step 4a ---
+def popctrs_dict():
+    """
+    returns health regions and their keywords from the popctrs-dict tab
+    """
+    hrs = read_sheet(paths.CONCORDANCE, 'popctrs-dict')
+    hrs = hrs.set_index(hrs.columns[0]).iloc[:, 0]
+    return {key: value.split(', ') for key, value in hrs.items()}
+
+
+def confidence(regions, jurisdiction, provinces):
+    """
+    high: one health region in the entry's jurisdiction
+    medium: several health regions, all in the entry's jurisdiction
+    low: a health region outside the entry's jurisdiction (or not in POPCTRS)
+    none: no keyword found
+    """
+    if not regions:
+        return 'none'
+    if any(provinces.get(r) != jurisdiction for r in regions):
+        return 'low'
+    return 'high' if len(regions) == 1 else 'medium'
 
-# Step 3 ---
-# Separate those at regional/municipal level from the rest 
-regional = new4.loc[(new3.Level == "Regional") | (new4.Level == "Municipal")]
-rest = new4.loc[(new3.Level != "Regional") | (new4.Level != "Municipal")]
-print("{} new regional entries, {} new provincial/territorial".format(len(regional), len(rest)))
 
-# Merge provincial/territorial and federal with reference
-out = pd.merge(reference, rest, how = 'right')
+def suggest_hr(regional, dictionary, reference):
+    """
+    regional is the regional/municipal entries of the release, dictionary the popctrs-dict keywords
+    returns one review row per entry with the suggested health regions and the keywords found
+    """
+    order = list(dictionary)
+    provinces = reference.set_index('health_region').Jurisdiction.to_dict()
+    found = find_keywords(regional['Intervention summary'], dictionary)
 
+    review = regional[['Entry ID', 'Jurisdiction', 'Date implemented', 'Intervention summary']].copy()
+    regions = [[k for k in order if k in f] for f in found]
 
+    review['suggested'] = [", ".join(r) for r in regions]
+    review['confidence'] = [confidence(r, j, provinces) for r, j in zip(regions, review.Jurisdiction)]
+    review['evidence'] = ["; ".join("{}: {}".format(k, ", ".join(sorted(f[k]))) for k in r) for r, f in zip(regions, found)]
+    review['health_region'] = review['suggested']
+    review['approved'] = ''
+    return review.reset_index(drop = True)
 
-# Step 4a ---
-# Create a reference dictionary using keywords
-print("Creating reference dictionary using keywords................")
-hrs = defaultdict(list)
-hrs = pd.read_excel('data/interventions/place-types-concordance.xlsx', sheet_name = 'popctrs-dict').set_index('health_reg').transpose().to_dict('records', into=hrs)
 
-for item in hrs:
-    for key,value in item.items():
-        print(key, value.split(', '))
+def confirm(review):
+    """
+    asks for every suggestion at the prompt, fills in approved
+    """
+    review = review.copy()
+    for i, row in review.iterrows():
+        print("\n{}".format(row['Intervention summary']))
+        print("Found {} in summary ({}; {})".format(row.suggested or None, row.confidence, row.evidence))
+
+        response = input("Type 'yes' to add to health regions, otherwise type 'no'.")
+        review.loc[i, 'approved'] = 'yes' if response == 'yes' else 'no'
+    return review
+
 
-hrs2 = {key: value.split(', ') for key, value in item.items() for item in hrs} 
+def read_review(path):
+    review = pd.read_csv(path, dtype = str, keep_default_na = False)
+    review['approved'] = review.approved.str.strip().str.lower()
+    return review
 
 
-# Generate suggested HRs using reference dictionary
-def retrieve_hr(x, dictionary):
+def apply_review(regional, review):
     """
-    x is a summary description of the policy intervention formatted as a string
-    d is a dictionary of industries and keywords associated
+    regional is the regional/municipal entries of the release, review the approved review file
+    returns one row per entry and approved health region; entries without one (suggestion
+    rejected, or approved without a health region) are kept once with an empty health_region
     """
-    # set and reset tags
-    tags = set()
-    try:
-        for k in dictionary.keys():
-            for v in dictionary[k]:
-                if x.lower().find(v) > -1:
-                    tags.add(k)
-                    print('found {} in summary, adding {}'.format(v, k))
-                    break
-
-    #         print("----\ncurrent tags: {}\n----".format(tags))
-    except AttributeError:
-        pass
-    
-    if len(tags) == 0:
-        tags.add(None)
-    
-    print("Found {} in summary".format(", ".join(str(e) for e in tags)))
-
-    response = input("Type 'yes' to add to health regions, otherwise type 'no'.")
-    if response == 'yes':
-        return ", ".join(str(e) for e in tags)
-    elif response == 'no':
-        return None
-
-print("Generating suggested HRs using reference dict................")
-regional['Intervention summary'].map(lambda x: retrieve_hr(x, hrs2))
-
-
-
-# Step 4b ---
-# Manually add health regions
-print("Manually adding health regions................")
-regional['health_region'] = "Capitale-Nationale"
-regional = pd.concat([regional, regional]).reset_index()
-regional.loc[1, "health_region"] = 'Montréal'
-
-# Re-concatenate and add to old
-final = pd.concat([old, out, regional]).reset_index().drop(columns = 'index')
-
-# Step 5 --- Clean & Export
-print("Exporting as InterventionScan_Nov.csv ................")
-final.drop(columns= 'level_0').to_csv('../data/interventions/InterventionScan_Nov.csv', encoding = "utf-8-sig")
-print("WARNING: Validate this file by hand.")
+    unreviewed = set(regional['Entry ID'].astype(str)) - set(review.loc[review.approved.isin(['yes', 'no']), 'Entry ID'])
+    if unreviewed:
+        raise ValueError("{} regional entries are not approved in the review file: {}".format(
+            len(unreviewed), ", ".join(sorted(unreviewed))))
+
+    approved = review.loc[(review.approved == 'yes') & (review.health_region != ''), ['Entry ID', 'health_region']]
+    approved = approved.assign(health_region = approved.health_region.str.split(r',\s*')).explode('health_region')
+
+    regional = regional.assign(**{'Entry ID': regional['Entry ID'].astype(str)})
+    regional = pd.merge(regional, approved, on = 'Entry ID', how = 'left')
+
+    missing = regional.health_region.isna()
+    if missing.any():
+        print("{} regional entries without an approved health region, exported with an empty health_region".format(missing.sum()))
+    regional['health_region'] = regional.health_region.fillna('')
+    return regional
+
+
+@instrument.measured
+def CIHIUpdate(cutoff, batch = False, approved = None):
+    """
+    cutoff is the final date of the previous release (YYYY-MM-DD)
+    batch writes the suggestions to the review file and stops
+    approved is a review file with the approved column filled in, used instead of the prompt
+    returns the exported table (None in batch mode)
+    """
+    old = read_sheet(OLD, "top30")
+    popctrs = pd.read_csv(paths.POPCTRS)
+
+    new4 = read_release(cutoff)
+    reference = reference_regions(popctrs)
+
+    # Step 3 ---
+    # Separate those at regional/municipal level from the rest
+    local = new4.Level.isin(["Regional", "Municipal"])
+    regional = new4.loc[local]
+    rest = new4.loc[~local]
+    print("{} new regional entries, {} new provincial/territorial".format(len(regional), len(rest)))
+
+    # Merge provincial/territorial and federal with reference
+    out = pd.merge(reference, rest, how = 'right')
+
+    # Step 4 --- health regions of regional entries
+    if approved is not None:
+        review = read_review(approved)
+    else:
+        print("Generating suggested HRs using reference dict................")
+        review = suggest_hr(regional, popctrs_dict(), reference)
+        print(review.confidence.value_counts().to_string())
+
+        if batch:
+            review[REVIEW_COLUMNS].to_csv(REVIEW, index = False, encoding = "utf-8-sig")
+            print("Review the suggestions in {} and rerun with --approved".format(REVIEW))
+            return None
+
+        review = confirm(review)
+        review[REVIEW_COLUMNS].to_csv(REVIEW, index = False, encoding = "utf-8-sig")
+
+    regional = apply_review(regional, review)
+
+    # Re-concatenate and add to old
+    final = pd.concat([old, out, regional]).reset_index(drop = True)
+
+    # Step 5 --- Clean & Export
+    print("Exporting as {} ................".format(os.path.basename(EXPORT)))
+    final.to_csv(EXPORT, encoding = "utf-8-sig")
+    print("WARNING: Validate this file by hand.")
+    return final
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description = 'Add a CIHI intervention scan release to the master intervention list.')
+    parser.add_argument('--cutoff', help = 'final date of the previous release (YYYY-MM-DD)')
+    parser.add_argument('--batch', action = 'store_true', help = 'write health region suggestions to the review file and stop')
+    parser.add_argument('--approved', help = 'approved review file, applied without prompting')
+    args = parser.parse_args()
 
+    cutoff = args.cutoff or input("Enter the final date of the previous release (YYYY-MM-DD): ")
+    CIHIUpdate(cutoff, batch = args.batch, approved = args.approved)
@@ -0,0 +1,183 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# Provincial tiered response frameworks (colour-coded levels per health region)
+#
+# Each framework declares where its data is, how its columns, tiers and regions map
+# onto the master intervention list, and which sheet of standardized-restrictions.xlsx
+# holds its tier summaries and severities (Level, Summary, Number).
+# The shared engine reads every framework in a thread pool, then standardizes them,
+# adds summaries and categories, and classifies level transitions.
+# To add a province, append a Framework to FRAMEWORKS (and its source to the
+# interventionsMerge inputs in update/pipeline.py).
+
+import os
+import sys
+import numpy as np
+import pandas as pd
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '../..'))
+from common import paths
+from common.fetch import open_source
+from common.workbooks import read_sheet
+
+
+# columns every framework contributes to the master list, in this order
+COLUMNS = ["Health Region", "Type", "Implemented", "Expired", "Jurisdiction", "Source", "Source type", "Summary", "Category"]
+
+
+class Framework:
+
+    def __init__(self, name, source, columns, tiers, regions, jurisdiction, source_type,
+                 categories, keep = None, sheet = None, read = pd.read_csv):
+        """
+        name identifies the framework, sheet (default: name) is its tab in standardized-restrictions.xlsx
+        source is the url or path of the data, read parses it
+        columns maps the source columns to Health Region, Type, Implemented, Expired
+        tiers maps the source tier names to the Level names of the sheet
+        regions maps the source region names to the health region names of the master list
+        categories maps Levels to a Category, levels without one are classified by transition
+        keep are the regions kept (default: all)
+        """
+        self.name = name
+        self.source = source
+        self.columns = columns
+        self.tiers = tiers
+        self.regions = regions
+        self.jurisdiction = jurisdiction
+        self.source_type = source_type
+        self.categories = categories
+        self.keep = keep
+        self.sheet = sheet or name
+        self.read = read
+
+
+ONTARIO = Framework(
+    'on', paths.ONTARIO_SOURCE,
+    columns = {
+        "Reporting_PHU": "Health Region",
+        "Status_PHU" : "Type",
+        "start_date" : "Implemented",
+        "end_date" : "Expired"
+    },
+    tiers = {
+        "Prevent": "Green - Prevent",
+        "Protect": "Yellow - Protect",
+        "Restrict": "Orange - Restrict",
+        "Control": "Red - Control",
+        "Lockdown": "Grey - Lockdown"
+    },
+    regions = {
+        'Durham Region Health Department': "Durham",
+        'Halton Region Health Department' : "Halton",
+        'Hamilton Public Health Services' : "Hamilton",
+        'Kingston, Frontenac and Lennox & Addington Public Health': "Kingston Frontenac Lennox & Addington",
+        'Middlesex-London Health Unit' : "Middlesex-London",
+        'Niagara Region Public Health Department': "Niagara",
+        'Ottawa Public Health': "Ottawa",
+        'Region of Waterloo, Public Health': "Waterloo",
+        'Simcoe Muskoka District Health Unit': "Simcoe Muskoka",
+        'Toronto Public Health': "Toronto",
+        'Wellington-Dufferin-Guelph Public Health': 'Wellington Dufferin Guelph',
+        'Windsor-Essex County Health Unit': "Windsor Essex",
+    },
+    jurisdiction = "Ont.",
+    source_type = "Ontario Data Catalogue",
+    categories = {
+        "Stay-at-home": "Restrictions",
+        "Yellow - Protect": "Restrictions",
+        "Orange - Restrict": "Restrictions",
+        "Green - Prevent": "Openings",
+        "Grey - Lockdown": "Closures",
+    },
+    keep = ['Durham', 'Halton', 'Hamilton',
+           'Kingston Frontenac Lennox & Addington',
+           'Middlesex-London', 'Niagara', 'Ottawa',
+            'Waterloo', 'Simcoe Muskoka',
+            'Toronto', 'Wellington Dufferin Guelph', 'Windsor Essex'
+           ])
+
+
+FRAMEWORKS = [ONTARIO]
+
+
+def level_transitions(df, conversions, by = "Health Region", date = "Implemented"):
+    """
+    df has Type, by and date columns
+    conversions maps Type to its severity (Number in standardized-restrictions.xlsx)
+    maps category based on PREVIOUS type of the same region: Openings when going LOWER in restrictions, else Closures.
+    None for the first entry of a region, or when either type has no severity.
+    returns a series aligned with df.index
+    """
+    # entries of a region in date order, ties kept in file order
+    ordered = df.sort_values([by, date], kind = "mergesort")
+
+    current = ordered.Type.map(conversions).astype(float)
+    previous = current.groupby(ordered[by]).shift()
+
+    transitions = pd.Series(np.where(previous > current, "Openings", "Closures"), index = ordered.index, dtype = object)
+    transitions[previous.isna() | current.isna()] = None
+    return transitions.reindex(df.index)
+
+
+def fetch(framework, standards):
+    """
+    reads the framework's data and its tab of the standards workbook
+    """
+    raw = framework.read(open_source(framework.source))
+    levels = read_sheet(standards, framework.sheet).set_index("Level")
+    return raw, levels
+
+
+def standardize(framework, raw):
+    """
+    Step 1 & 2 --- standardize columns, intervention type and health regions
+    """
+    df = raw.rename(columns = framework.columns)
+
+    df["Type"] = df.Type.replace(framework.tiers)
+    df["Health Region"] = df["Health Region"].replace(framework.regions)
+
+    # same dtype as the manual dates so the columnar store can keep them
+    df["Implemented"] = pd.to_datetime(df.Implemented)
+    df["Expired"] = pd.to_datetime(df.Expired)
+
+    df["Jurisdiction"] = framework.jurisdiction
+    df["Source"] = framework.source
+    df["Source type"] = framework.source_type
+    return df
+
+
+def classify(framework, df, levels):
+    """
+    Step 3 & 4 --- filter regions, add summary and category
+    levels is the framework's tab of standardized-restrictions.xlsx, indexed by Level
+    """
+    kept = df["Type"] != "Other"
+    if framework.keep is not None:
+        kept &= df["Health Region"].str.contains("|".join(framework.keep)) == True
+    df = df.loc[kept].copy()
+
+    df["Summary"] = df.Type.map(levels["Summary"].to_dict())
+    df["Category"] = df.Type.map(framework.categories)
+
+    # fills in blanks for Category
+    df["Category"] = df["Category"].fillna(level_transitions(df, levels["Number"].to_dict()))
+    return df[COLUMNS]
+
+
+def load(frameworks = None, standards = None, threads = None):
+    """
+    frameworks to load (default: FRAMEWORKS), standards is standardized-restrictions.xlsx
+    downloads run concurrently in threads
+    returns the standardized interventions of all frameworks
+    """
+    frameworks = FRAMEWORKS if frameworks is None else frameworks
+    standards = standards or paths.STANDARDS
+
+    with ThreadPoolExecutor(max_workers = threads or max(len(frameworks), 1)) as pool:
+        fetched = list(pool.map(lambda f: fetch(f, standards), frameworks))
+
+    parts = [classify(f, standardize(f, raw), levels) for f, (raw, levels) in zip(frameworks, fetched)]
+    return pd.concat(parts) if parts else pd.DataFrame(columns = COLUMNS)
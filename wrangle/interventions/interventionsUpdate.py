@@ -8,55 +8,97 @@
 #
 # Tags were validated by comparing manually labelled entries with suggested tags. Mismatches were either attributed to incorrect/redundant/inapplicable keywords or manual tags.
 
+import os
+import sys
 import pandas as pd
 import datetime as dt
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '../..'))
+from common import instrument, paths, snapshots, store
+from common.keywords import find_keywords
+from common.workbooks import read_sheet
 
-# Step 1 ---
-d = dict()
-d = pd.read_excel('../data/interventions/place-types-concordance.xlsx', sheet_name = 'industries-dict').set_index('industry').transpose().to_dict('records', into=d)
 
-interv = pd.read_csv('../data/interventions/master.csv')
+CONCORDANCE = paths.CONCORDANCE
+
 
+# Step 1 ---
+def industries_dict():
+    """
+    returns industries and their keywords from the industries-dict tab
+    """
+    d = dict()
+    d = read_sheet(CONCORDANCE, 'industries-dict').set_index('industry').transpose().to_dict('records', into=d)
 
-d2 = {key: value.split(', ') for key, value in d[0].items()} 
+    return {key: value.split(', ') for key, value in d[0].items()}
 
 
 # Step 2 ---
+def tag_industries(summaries, dictionary):
+    """
+    summaries is the Summary column, dictionary the industries and their keywords from industries_dict
+    returns the Industry tags of every summary, in the order of the industries-dict tab ("None" when untagged)
+    scans all the summaries at once with a single compiled pattern
+    """
+    order = list(dictionary)
+    tags = find_keywords(summaries, dictionary)
+
+    return pd.Series([", ".join(k for k in order if k in t) if t else "None" for t in tags],
+                     index = summaries.index if isinstance(summaries, pd.Series) else None, dtype = object)
+
+
 def retrieve_industry(x, dictionary):
     """
     x is a summary description of the policy intervention formatted as a string
     d is a dictionary of industries and keywords associated. values are in a list.
     """
-    # set and reset tags
-    tags = set()
-    
-    try:
-        for k in dictionary.keys():
-            for v in dictionary[k]:
-    #             print('checking for {}'.format(v))
-                if x.lower().find(v) > -1:
-                    tags.add(k)
-    #                 print('found {} in summary, adding {}'.format(v, k))
-                    break
-
-    #         print("----\ncurrent tags: {}\n----".format(tags))
-    except AttributeError:
-        pass
-    
-    if len(tags) == 0:
-        tags.add(None)
-    
-    return ", ".join(str(e) for e in tags)
-
-
-interv['Industry'] = interv['Summary'].map(lambda x: retrieve_industry(x, d2))
-
-
-# Step 3 --- 
-interv = interv.loc[interv['Category'].str.contains("Openings|Closures|Restrictions|Restriction release") == True]
-
-latest = dt.datetime.today().strftime("%Y-%m-%d")
-print("Creating file: InterventionScan_Processed_{}.csv".format(latest))
-interv.to_csv('../../viz/CovidTimeline/data/input/InterventionScan_Processed_{}.csv'.format(latest), encoding = 'utf-8-sig')
+    return tag_industries([x], dictionary).iloc[0]
+
+
+def process(master, dictionary):
+    """
+    master is the intervention table from interventionsMerge, dictionary the industries from industries_dict
+    returns the tagged Closures, Openings, Restrictions and Restriction releases
+    """
+    # keep the old index as the 'Unnamed: 0' column, create_rda.R selects columns by position
+    interv = master.rename_axis('Unnamed: 0').reset_index()
+    interv['Industry'] = tag_industries(interv['Summary'], dictionary)
+
+
+    # Step 3 --- 
+    return interv.loc[interv['Category'].str.contains("Openings|Closures|Restrictions|Restriction release") == True]
+
+
+def export(interv, date, directory = None):
+    """
+    writes interv as InterventionScan_Processed_<date>.csv in directory (default: the dashboard inputs)
+    returns its path
+    """
+    path = os.path.join(directory or paths.VIZ_INPUT, 'InterventionScan_Processed_{}.csv'.format(date))
+    interv.to_csv(path, encoding = 'utf-8-sig')
+    return path
+
+
+@instrument.measured
+def interventionsUpdate(master = None):
+    """
+    master is the intervention table from interventionsMerge (read from wrangle/data/interventions when not given)
+    returns the exported table
+    """
+    if master is None:
+        master = store.read(paths.MASTER, index_col = 0)
+
+    interv = process(master, industries_dict())
+
+    latest = dt.datetime.today().strftime("%Y-%m-%d")
+    print("Creating file: InterventionScan_Processed_{}.csv".format(latest))
+    export_path = export(interv, latest)
+
+    # keep the release in the snapshot store (older dated copies are removed with update/snapshots.py prune)
+    snapshots.commit('interventions', latest, [export_path])
+    return interv
+
+
+if __name__ == '__main__':
+    interventionsUpdate()
 
@@ -0,0 +1,186 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# Summary cube for the dashboard
+#
+# One row per health region (with population centres) per week, precomputed so the viz layer
+# looks figures up instead of aggregating master.df and the intervention table on every interaction:
+#   cases, cumulative_cases          weekly and running total of reported cases (at the end of the week)
+#   avg_7d, avg_14d                  daily average over the last 7 and 14 days
+#   growth_wow, doubling_days        week over week growth and doubling time of the cases
+#                                    (these four and cumulative_cases from the case metrics as of the week's
+#                                    last reported day, see metrics.py)
+#   *_per_100k                       per 100,000 residents of the region's population centres (POPCTRRApop_2016)
+#   interventions, interventions_*   interventions implemented that week, in total and per Category
+#
+# Weeks are labelled by the Monday closing them, like the weekly case time series.
+# Written to viz/CovidTimeline/data/input/summary_cube.parquet (read in R with arrow::read_parquet).
+
+import os
+import re
+import sys
+import glob
+import numpy as np
+import pandas as pd
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '../..'))
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '../cases'))
+from common import instrument, paths, store
+from common.resample import week_ending_days
+from common.timeseries import read_daily
+
+import popctrs
+import metrics as case_metrics
+
+
+def read_interventions():
+    """
+    returns the latest InterventionScan_Processed_<date>.csv (None when there is none)
+    """
+    exports = sorted(glob.glob(os.path.join(paths.VIZ_INPUT, 'InterventionScan_Processed_*.csv')))
+    if not exports:
+        return None
+    return pd.read_csv(exports[-1], encoding = 'utf-8-sig')
+
+
+def parse_dates(dates):
+    """
+    dates were written by hand and by several stages: 2020-09-10, 2020-09-10 00:00:00, 2020-11-07T00:00:00
+    returns them as datetimes (NaT when missing or unreadable)
+    """
+    return pd.to_datetime(dates, format = 'ISO8601', errors = 'coerce').astype('datetime64[ns]')
+
+
+def week_of(dates):
+    """
+    dates is a datetime series without missing dates
+    returns the Monday closing the W-Mon week of each date
+    """
+    days = week_ending_days(dates.values)
+    return pd.Series(pd.to_datetime(days, unit = 'D'), index = dates.index).astype('datetime64[ns]')
+
+
+def category_column(category):
+    return 'interventions_' + re.sub(r'\W+', '_', str(category).strip().lower())
+
+
+def intervention_counts(interventions, regions):
+    """
+    interventions has Health Region, Implemented and Category, regions maps Health Region to HR_UID
+    returns the number of interventions per HR_UID, week and Category (one column per Category)
+    """
+    implemented = parse_dates(interventions.Implemented)
+    interv = interventions.loc[interventions['Health Region'].isin(regions.index) & implemented.notna()]
+    if interv.empty:
+        return pd.DataFrame(index = pd.MultiIndex.from_arrays([[], []], names = ['HR_UID', 'week']))
+
+    counts = pd.crosstab([interv['Health Region'].map(regions).rename('HR_UID'), week_of(implemented[interv.index]).rename('week')],
+                         interv.Category.map(category_column))
+    counts.columns.name = None
+    return counts
+
+
+def dashboard_regions(geometry, n = None, points = None):
+    """
+    geometry is the health region geometry table from mergeHR
+    returns the regions the dashboard shows, those with population centres (HR_UID, province, Health Region),
+    and their population by HR_UID
+    """
+    geometry = geometry.rename(columns = {"Health Reg": "Health Region"})
+    regions = pd.DataFrame(geometry[['HR_UID', 'province', 'Health Region']]).astype({'HR_UID': str}).drop_duplicates('HR_UID')
+
+    population = popctrs.region_population(geometry, n, points)
+    regions = regions.loc[regions.HR_UID.isin(population.index)].reset_index(drop = True)
+    return regions, population
+
+
+def region_ids(regions):
+    """
+    returns the HR_UID of each Health Region name (interventions only name their region)
+    """
+    return regions.drop_duplicates('Health Region').set_index('Health Region').HR_UID
+
+
+def weekly_cases(facts, regions):
+    """
+    returns the weekly cases of regions, sorted by HR_UID and week
+    """
+    weeks = facts[['HR_UID', 'date_report', 'cases', 'cumulative_cases']].astype({'HR_UID': str}).rename(columns = {'date_report': 'week'})
+    weeks = weeks.loc[weeks.HR_UID.isin(regions.HR_UID)]
+    # one resolution for every date, merge_asof needs matching keys
+    weeks['week'] = pd.to_datetime(weeks.week).astype('datetime64[ns]')
+    return weeks.sort_values(['HR_UID', 'week'], kind = 'mergesort').reset_index(drop = True)
+
+
+def rolling_metrics(cube, metrics):
+    """
+    cube has HR_UID and week, metrics is the case metrics table (see metrics.py)
+    returns the running total and rolling metrics of each row's week, as of its last reported day
+    """
+    columns = ['cumulative_cases', 'avg_7d', 'avg_14d', 'growth_wow', 'doubling_days']
+    daily = pd.DataFrame(metrics[['HR_UID', 'date_report'] + columns]).astype({'HR_UID': str})
+    daily['date_report'] = daily.date_report.astype('datetime64[ns]')
+
+    weeks = cube[['HR_UID', 'week']].assign(row = np.arange(len(cube))).sort_values('week', kind = 'mergesort')
+    rolling = pd.merge_asof(weeks, daily.sort_values('date_report', kind = 'mergesort'),
+                            left_on = 'week', right_on = 'date_report', by = 'HR_UID', direction = 'backward')
+    return rolling.sort_values('row')[columns].set_index(cube.index)
+
+
+@instrument.measured
+def summaryCube(merged = None, interventions = None, n = None, points = None, metrics = None):
+    """
+    merged is the health region geometry and weekly case facts from mergeHR
+    (read from wrangle/data/shapefiles when not given)
+    interventions is the processed intervention table from interventionsUpdate
+    (the latest InterventionScan_Processed_<date>.csv when not given)
+    n and points select the population centres counted in the populations (see popctrs.py)
+    metrics is the table from caseMetrics (case_metrics.parquet when not given, computed when missing)
+    returns the cube
+    """
+    if merged is None:
+        merged = store.read_geo(paths.HR_GEOMETRY), store.read(paths.HR_CASES)
+    geometry, facts = merged
+    if interventions is None:
+        interventions = read_interventions()
+
+    regions, population = dashboard_regions(geometry, n, points)
+    if metrics is None and store.exists(paths.METRICS, 'parquet'):
+        metrics = store.read(paths.METRICS, 'parquet')
+    elif metrics is None:
+        metrics = case_metrics.case_metrics(read_daily(paths.DAILY), case_metrics.read_crosswalk(), population)
+    print("Summarizing {} health regions.".format(len(regions)))
+
+    cube = pd.merge(regions, weekly_cases(facts, regions), on = 'HR_UID')
+
+    # the weekly cumulative_cases sums the daily running totals, the running total at the end
+    # of the week is the daily one on its last reported day
+    cube = cube.drop(columns = 'cumulative_cases').join(rolling_metrics(cube, metrics))
+    cube.insert(cube.columns.get_loc('cases') + 1, 'cumulative_cases', cube.pop('cumulative_cases'))
+
+    per_100k = 100000 / cube.HR_UID.map(population).astype(float)
+    cube['population'] = cube.HR_UID.map(population)
+    for column in ['cases', 'cumulative_cases', 'avg_7d']:
+        cube[column + '_per_100k'] = cube[column] * per_100k
+
+    # interventions implemented in each region and week
+    if interventions is not None:
+        counts = intervention_counts(interventions, region_ids(regions))
+        cube = pd.merge(cube, counts, left_on = ['HR_UID', 'week'], right_index = True, how = 'left')
+        categories = list(counts.columns)
+        cube[categories] = cube[categories].fillna(0).astype(np.int16)
+        cube.insert(len(cube.columns) - len(categories), 'interventions', cube[categories].sum(axis = 1).astype(np.int16))
+
+    # compact types: labels as categories, counts as 32 bit integers, rates as 32 bit floats
+    cube = cube.astype({'HR_UID': 'category', 'province': 'category', 'Health Region': 'category',
+                        'cases': np.int32, 'cumulative_cases': np.int32, 'population': np.int32})
+    floats = [c for c in cube.columns if c.startswith('avg_') or c.endswith('_per_100k') or c in ['growth_wow', 'doubling_days']]
+    cube[floats] = cube[floats].astype(np.float32)
+
+    print("Creating file: {}".format(os.path.basename(store.path_for(paths.SUMMARY_CUBE, 'parquet'))))
+    store.write(cube, paths.SUMMARY_CUBE, fmt = 'parquet', index = False)
+    return cube
+
+
+if __name__ == '__main__':
+    summaryCube()
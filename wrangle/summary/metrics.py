@@ -0,0 +1,156 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# Case metrics
+#
+# Rates and trends of the daily case series, computed once for every consumer (summary cube, dashboard):
+# one row per health region (HR_UID) per day
+#   cases, cumulative_cases              reported that day, running total
+#   sum_7d, avg_7d, sum_14d, avg_14d     cases over the last 7 and 14 days (that day included) and their daily average
+#   growth_wow                           week over week growth of sum_7d (0.25: a quarter more cases than the 7 days before)
+#   doubling_days                        days for cumulative_cases to double at the growth of the last 7 days (NaN when not growing)
+#   population, *_per_100k               per 100,000 residents of the region's population centres (POPCTRRApop_2016)
+#
+# The series is sorted by HR_UID and day once. Every window is a difference of one cumulative sum,
+# bounded by a binary search on a (region, day) key, so it never reaches into the previous region
+# and counts missing days as 0.
+# Written to viz/CovidTimeline/data/input/case_metrics.parquet (read in R with arrow::read_parquet).
+
+import os
+import sys
+import numpy as np
+import pandas as pd
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '../..'))
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '../cases'))
+from common import instrument, paths, store
+from common.timeseries import read_daily
+
+import popctrs
+
+
+WINDOWS = [7, 14]
+WEEK = 7
+
+
+def read_crosswalk():
+    """
+    returns the case regions with a boundary from the crosswalk written by mergeHR
+    """
+    return pd.read_csv(paths.HR_CROSSWALK, dtype = str).dropna(subset = ['HR_UID'])
+
+
+def region_days(daily, crosswalk):
+    """
+    daily is the daily case series (province, health_region, date_report, cases, cumulative_cases)
+    returns the cases per HR_UID and day, sorted by HR_UID and day (regions without a boundary are dropped)
+    """
+    # every boundary of a case region gets its cases, as in mergeHR.case_facts
+    regions = crosswalk[['province', 'health_region', 'HR_UID']].drop_duplicates()
+    daily = daily.astype({'province': str, 'health_region': str})
+    located = pd.merge(daily[['province', 'health_region', 'date_report', 'cases', 'cumulative_cases']], regions,
+                       on = ['province', 'health_region'])
+
+    # case regions sharing a boundary are added up
+    days = located.groupby(['HR_UID', 'date_report'], sort = True)[['cases', 'cumulative_cases']].sum().reset_index()
+    days['date_report'] = days.date_report.astype('datetime64[ns]')
+    return days
+
+
+def day_keys(regions, dates):
+    """
+    regions and dates are sorted by region then date
+    returns a sorted integer key per row: region code * stride + day, with a stride wide enough
+    that looking back any window or lag lands before the region's first day, not in the previous region
+    """
+    codes = pd.factorize(regions, sort = True)[0].astype(np.int64)
+    days = dates.values.astype('datetime64[D]').astype(np.int64)
+    days = days - days.min() if len(days) else days
+    stride = (days.max() + 1 if len(days) else 1) + 2 * max(WINDOWS + [WEEK])
+    return codes * stride + days
+
+
+def window_sums(values, keys, window):
+    """
+    returns the sum of values over the `window` days up to each row (same region only)
+    """
+    total = np.concatenate([[0], np.cumsum(values, dtype = np.float64)])
+    start = np.searchsorted(keys, keys - window, side = 'right')
+    return total[1:] - total[start]
+
+
+def lagged(values, keys, lag):
+    """
+    returns the value of the same region `lag` days before each row (NaN when there is no such day)
+    """
+    at = np.searchsorted(keys, keys - lag)
+    found = at < len(keys)
+    found[found] = keys[at[found]] == (keys - lag)[found]
+
+    out = np.full(len(values), np.nan)
+    out[found] = values[at[found]]
+    return out
+
+
+def case_metrics(daily, crosswalk, population):
+    """
+    daily is the daily case series, crosswalk the one written by mergeHR,
+    population the population of each health region indexed by HR_UID (see popctrs.region_population)
+    returns the metrics table
+    """
+    days = region_days(daily, crosswalk)
+    keys = day_keys(days.HR_UID, days.date_report)
+    cases = days.cases.values.astype(np.float64)
+    cumulative = days.cumulative_cases.values.astype(np.float64)
+
+    for window in WINDOWS:
+        days['sum_{}d'.format(window)] = window_sums(cases, keys, window)
+        days['avg_{}d'.format(window)] = days['sum_{}d'.format(window)] / window
+
+    with np.errstate(divide = 'ignore', invalid = 'ignore'):
+        growth = days.sum_7d.values / lagged(days.sum_7d.values, keys, WEEK) - 1
+        ratio = cumulative / lagged(cumulative, keys, WEEK)
+        doubling = WEEK * np.log(2) / np.log(ratio)
+    days['growth_wow'] = np.where(np.isfinite(growth), growth, np.nan)
+    days['doubling_days'] = np.where(ratio > 1, doubling, np.nan)
+
+    days['population'] = days.HR_UID.map(population.rename(lambda i: str(i))).astype('Int32')
+    per_100k = 100000 / days.population.astype(float)
+    for column in ['sum_7d', 'avg_7d', 'sum_14d', 'cumulative_cases']:
+        days[column + '_per_100k'] = days[column] * per_100k
+
+    names = crosswalk[['HR_UID', 'province', 'Health Region']].drop_duplicates('HR_UID')
+    metrics = pd.merge(names, days, on = 'HR_UID', how = 'right')
+
+    # compact types: labels as categories, counts as 32 bit integers, rates as 32 bit floats
+    metrics = metrics.astype({'HR_UID': 'category', 'province': 'category', 'Health Region': 'category',
+                              'cases': np.int32, 'cumulative_cases': np.int32,
+                              'sum_7d': np.int32, 'sum_14d': np.int32})
+    floats = [c for c in metrics.columns if c.startswith('avg_') or c.endswith('_per_100k') or c in ['growth_wow', 'doubling_days']]
+    metrics[floats] = metrics[floats].astype(np.float32)
+    return metrics
+
+
+@instrument.measured
+def caseMetrics(merged = None, daily = None, n = None, points = None):
+    """
+    merged is the health region geometry and weekly case facts from mergeHR
+    (read from wrangle/data/shapefiles when not given), daily the daily case series (read from collect/data)
+    n and points select the population centres counted in the populations (see popctrs.py)
+    returns the metrics table
+    """
+    geometry = merged[0] if merged is not None else store.read_geo(paths.HR_GEOMETRY)
+    if daily is None:
+        daily = read_daily(paths.DAILY)
+
+    population = popctrs.region_population(geometry.rename(columns = {"Health Reg": "Health Region"}), n, points)
+    metrics = case_metrics(daily, read_crosswalk(), population)
+    print("Computed case metrics for {} health regions over {} days.".format(metrics.HR_UID.nunique(), metrics.date_report.nunique()))
+
+    print("Creating file: {}".format(os.path.basename(store.path_for(paths.METRICS, 'parquet'))))
+    store.write(metrics, paths.METRICS, fmt = 'parquet', index = False)
+    return metrics
+
+
+if __name__ == '__main__':
+    caseMetrics()
@@ -0,0 +1,148 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# Case / intervention timeline index
+#
+# Lines the interventions up with the weekly case series of their health region with as-of joins
+# (pd.merge_asof by HR_UID), for the regions of the summary cube:
+#   timeline_interventions   every intervention with the cases of its week and of the `window` weeks before and after
+#   timeline_weeks           every case week with the latest intervention implemented by then and the number in effect
+#   timeline_active          one row per case week and intervention in effect (implemented, not yet expired)
+# Tables are sorted by HR_UID then date, so "what was active when" is a binary search, not a scan.
+# Written to viz/CovidTimeline/data/input/timeline_*.parquet.
+
+import os
+import sys
+import numpy as np
+import pandas as pd
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '../..'))
+from common import instrument, paths, store
+
+from cube import dashboard_regions, parse_dates, read_interventions, region_ids, week_of, weekly_cases
+
+
+WINDOW = 2
+
+INTERVENTION_COLUMNS = ['intervention', 'Entry ID', 'Health Region', 'Category', 'Type', 'Implemented', 'Expired']
+
+
+def located_interventions(interventions, regions):
+    """
+    returns the interventions of regions with their HR_UID, sorted by Implemented
+    (intervention is the row of the intervention in the processed table)
+    """
+    interv = interventions.reset_index(drop = True).rename_axis('intervention').reset_index()
+    interv['Implemented'] = parse_dates(interv.Implemented)
+    interv['Expired'] = parse_dates(interv.Expired) if 'Expired' in interv else pd.NaT
+
+    interv['HR_UID'] = interv['Health Region'].map(region_ids(regions))
+    interv = interv.loc[interv.HR_UID.notna() & interv.Implemented.notna()]
+    columns = [c for c in INTERVENTION_COLUMNS if c in interv]
+    return interv[['HR_UID'] + columns].astype({'HR_UID': str}).sort_values('Implemented', kind = 'mergesort').reset_index(drop = True)
+
+
+def windows(weeks, window):
+    """
+    weeks is the dense weekly case series of every region, sorted by HR_UID and week
+    returns weeks with the cases of the window weeks before and after each week (NaN past either end)
+    """
+    weeks = weeks.copy()
+    cases = weeks.groupby('HR_UID', sort = False).cases
+    weeks['cases_before'] = sum(cases.shift(i) for i in range(1, window + 1))
+    weeks['cases_after'] = sum(cases.shift(-i) for i in range(1, window + 1))
+    return weeks
+
+
+def around_interventions(interv, weeks):
+    """
+    every intervention with the cases of the week it was implemented in (the first week ending on or after it)
+    """
+    around = pd.merge_asof(interv, weeks.sort_values('week', kind = 'mergesort'),
+                           left_on = 'Implemented', right_on = 'week', by = 'HR_UID', direction = 'forward')
+    around['change'] = around.cases_after / around.cases_before - 1
+    around.loc[~np.isfinite(around.change), 'change'] = np.nan
+    return around.sort_values(['HR_UID', 'Implemented'], kind = 'mergesort').reset_index(drop = True)
+
+
+def active_interventions(interv, weeks):
+    """
+    one row per case week and intervention in effect that week
+    an intervention is in effect from the week it was implemented to the week it expired (or the region's last week)
+    """
+    last = weeks.groupby('HR_UID').week.max()
+    start = week_of(interv.Implemented)
+    end = week_of(interv.Expired.fillna(interv.HR_UID.map(last)))
+
+    count = ((end - start).dt.days // 7 + 1).clip(lower = 0).values
+    rows = np.repeat(np.arange(len(interv)), count)
+    offset = np.arange(len(rows)) - np.repeat(np.cumsum(count) - count, count)
+
+    active = pd.DataFrame({
+        'HR_UID': interv.HR_UID.values[rows],
+        'week': start.values[rows] + pd.to_timedelta(offset * 7, unit = 'D').values,
+        'intervention': interv.intervention.values[rows],
+        'Category': interv.Category.values[rows],
+    })
+
+    # only weeks of the case series
+    active = pd.merge(active, weeks[['HR_UID', 'week']], on = ['HR_UID', 'week'])
+    return active.sort_values(['HR_UID', 'week', 'intervention'], kind = 'mergesort').reset_index(drop = True)
+
+
+def weeks_in_effect(interv, weeks, active):
+    """
+    every case week with the latest intervention implemented by the end of the week and the number in effect
+    """
+    latest = interv[['HR_UID', 'intervention', 'Category', 'Type', 'Implemented']].rename(columns = {
+        'intervention': 'latest_intervention', 'Category': 'latest_category',
+        'Type': 'latest_type', 'Implemented': 'latest_implemented'})
+
+    timeline = pd.merge_asof(weeks.sort_values('week', kind = 'mergesort'), latest,
+                             left_on = 'week', right_on = 'latest_implemented', by = 'HR_UID', direction = 'backward')
+
+    in_effect = active.groupby(['HR_UID', 'week']).size().rename('in_effect')
+    timeline = timeline.join(in_effect, on = ['HR_UID', 'week'])
+    timeline['in_effect'] = timeline.in_effect.fillna(0).astype(np.int16)
+    timeline['latest_intervention'] = timeline.latest_intervention.astype('Int32')
+    return timeline.sort_values(['HR_UID', 'week'], kind = 'mergesort').reset_index(drop = True)
+
+
+@instrument.measured
+def timelineIndex(merged = None, interventions = None, window = WINDOW, n = None, points = None):
+    """
+    merged is the health region geometry and weekly case facts from mergeHR
+    (read from wrangle/data/shapefiles when not given)
+    interventions is the processed intervention table from interventionsUpdate
+    (the latest InterventionScan_Processed_<date>.csv when not given)
+    window is the number of weeks counted before and after each intervention
+    returns the interventions, weeks and active tables
+    """
+    if merged is None:
+        merged = store.read_geo(paths.HR_GEOMETRY), store.read(paths.HR_CASES)
+    geometry, facts = merged
+    if interventions is None:
+        interventions = read_interventions()
+
+    regions, _ = dashboard_regions(geometry, n, points)
+    weeks = windows(weekly_cases(facts, regions).drop(columns = 'cumulative_cases'), window)
+    if interventions is None:
+        interventions = pd.DataFrame(columns = ['Health Region', 'Category', 'Type', 'Implemented', 'Expired'])
+    interv = located_interventions(interventions, regions)
+    print("Lining up {} interventions with {} case weeks.".format(len(interv), len(weeks)))
+
+    tables = {
+        'interventions': around_interventions(interv, weeks),
+        'active': active_interventions(interv, weeks),
+    }
+    tables['weeks'] = weeks_in_effect(interv, weeks, tables['active'])
+
+    for name, table in tables.items():
+        stem = '{}_{}'.format(paths.TIMELINE, name)
+        print("Creating file: {}".format(os.path.basename(store.path_for(stem, 'parquet'))))
+        store.write(table, stem, fmt = 'parquet', index = False)
+    return tables
+
+
+if __name__ == '__main__':
+    timelineIndex()